@@ -6,7 +6,7 @@ import configuracion as cfg
 
 from audio_grabar import grabar_audio, VOICES_DIR
 from audio_reconocer import recognize_flow
-from procesar_audio import plot_waveform, analyze_voice
+from procesar_audio import plot_waveform, analyze_voice, envolvente   # envolvente: web/utils/decimado.py
 
 from auth_system import (
     register_user, list_registered_users, login_by_voice,
@@ -179,13 +179,11 @@ def start_gui():
 
             # Forma de onda
             t = np.linspace(0, len(data) / samplerate, num=len(data))
-            ax1.plot(t, data)
+            ax1.plot(*envolvente(data, t, puntos=1000))
             ax1.set_title("Forma de onda")
 
-            # FFT
-            freqs = np.fft.rfftfreq(len(data), d=1/samplerate)
-            mags = np.abs(np.fft.rfft(data))
-            ax2.plot(freqs, mags)
+            # FFT (espectro ya calculado en analyze_voice)
+            ax2.plot(info['freqs'], info['espectro'])
             ax2.set_title("FFT")
             ax2.set_xlim(0, samplerate/2)
 
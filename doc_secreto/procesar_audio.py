@@ -2,10 +2,15 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.io.wavfile import read
-from scipy.signal import find_peaks
 import sounddevice as sd
 from scipy.io.wavfile import write
 import os
+import sys
+
+# Análisis y decimado min/max: las mismas implementaciones que usa la web
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "web"))
+from utils.decimado import envolvente
+from services.analisis_service import analizar_senal
 
 VOICES_DIR = "usuarios"
 os.makedirs(VOICES_DIR, exist_ok=True)
@@ -44,32 +49,23 @@ def guardar_voz(nombre_usuario, samplerate, data_int16):
 #   GRAFICAR: Onda y Espectro FFT
 # ==================================================
 def plot_waveform(path):
-    sr, data = read(path)
-
-    if data.ndim > 1:
-        data = data[:, 0]  # canal izquierdo
-
-    data = data.astype(np.float32)
+    info = analyze_voice(path)
+    data, sr = info["raw_data"], info["samplerate"]
     t = np.linspace(0, len(data) / sr, len(data))
 
     # Forma de onda
     plt.figure(figsize=(10, 4))
     plt.title("Onda temporal de la voz")
-    plt.plot(t, data)
+    plt.plot(*envolvente(data, t))
     plt.xlabel("Tiempo (s)")
     plt.ylabel("Amplitud")
     plt.grid()
     plt.show()
 
-    # FFT
-    N = len(data)
-    fft_vals = np.fft.rfft(data)
-    fft_freqs = np.fft.rfftfreq(N, 1 / sr)
-    mag = np.abs(fft_vals)
-
+    # FFT (espectro del análisis, sin otra transformada)
     plt.figure(figsize=(10, 4))
     plt.title("Espectro de frecuencias (FFT)")
-    plt.plot(fft_freqs, mag)
+    plt.plot(info["freqs"], info["espectro"])
     plt.xlim(0, 4000)
     plt.xlabel("Frecuencia (Hz)")
     plt.ylabel("Magnitud")
@@ -81,39 +77,29 @@ def plot_waveform(path):
 #   ANALIZAR VOZ (info avanzada)
 # ==================================================
 def analyze_voice(path):
+    """
+    Lee el WAV una vez y lo analiza con el mismo pipeline que la web
+    (web/services/analisis_service.py): estadísticas de la señal y, de una
+    sola STFT, el espectro, la frecuencia dominante y los picos. Las
+    gráficas usan este mismo resultado.
+    """
     sr, data = read(path)
 
     if data.ndim > 1:
         data = data[:, 0]
 
     data = data.astype(np.float32)
-
-    duration = len(data) / sr
-    rms = float(np.sqrt(np.mean(data ** 2)))
-    max_amp = float(np.max(np.abs(data)))
-
-    zero_cross = int(np.sum(np.abs(np.diff(np.sign(data))))) / duration / 2
-
-    # FFT
-    N = len(data)
-    fft_vals = np.fft.rfft(data)
-    fft_freqs = np.fft.rfftfreq(N, 1 / sr)
-    mag = np.abs(fft_vals)
-
-    dom_idx = np.argmax(mag)
-    dom_freq = float(fft_freqs[dom_idx])
-
-    # picos principales
-    peaks, _ = find_peaks(mag, height=np.max(mag) * 0.2)
-    top_peaks = [(float(fft_freqs[p]), float(mag[p])) for p in peaks[:10]]
+    a = analizar_senal(data, sr)
 
     return {
         "samplerate": sr,
-        "duration": duration,
-        "rms": rms,
-        "max_amplitud": max_amp,
-        "zero_cross_rate": zero_cross,
-        "dom_freq": dom_freq,
-        "top_peaks": top_peaks,
+        "duration": a.duracion,
+        "rms": a.rms,
+        "max_amplitud": a.amplitud_max,
+        "zero_cross_rate": a.zcr,
+        "dom_freq": a.f_dominante,
+        "top_peaks": [(float(f), float(m)) for f, m in a.picos],
+        "freqs": a.freqs,
+        "espectro": a.espectro,
         "raw_data": data
     }
@@ -22,6 +22,11 @@ import matplotlib.pyplot as plt
 import soundfile as sf
 import sounddevice as sd
 import os
+import sys
+
+# Decimado min/max para graficar: la misma implementación que usa la web
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "web", "utils"))
+from decimado import envolvente
 
 # === CONFIGURACIÓN ===
 CARPETA_AUDIOS = "audios_pruebas"
@@ -213,7 +218,7 @@ def graficar_onda_y_fft(senal, fs, titulo="Audio"):
 
     # === Forma de onda ===
     plt.subplot(2, 1, 1)
-    plt.plot(t, senal)
+    plt.plot(*envolvente(senal, t))
     plt.title(f"Forma de onda ({titulo})")
     plt.xlabel("Tiempo [s]")
     plt.ylabel("Amplitud")
@@ -228,7 +233,7 @@ def graficar_onda_y_fft(senal, fs, titulo="Audio"):
         magnitudes = np.array([0])
 
     plt.subplot(2, 1, 2)
-    plt.plot(frecuencias, magnitudes, color='orange')
+    plt.plot(*envolvente(magnitudes, frecuencias, rango=(0, 1000)), color='orange')
     plt.title("Espectro de frecuencias (FFT)")
     plt.xlabel("Frecuencia [Hz]")
     plt.ylabel("Magnitud")
@@ -266,8 +271,8 @@ def graficar_comparacion_fft(senal1, fs1, senal2, fs2, nombre1="audio1", nombre2
     mag2 = np.abs(np.fft.rfft(s2))
 
     plt.figure(figsize=(10, 5))
-    plt.plot(freqs, mag1, label=nombre1)
-    plt.plot(freqs, mag2, label=nombre2, linestyle="--")
+    plt.plot(*envolvente(mag1, freqs, rango=(0, 4000)), label=nombre1)
+    plt.plot(*envolvente(mag2, freqs, rango=(0, 4000)), label=nombre2, linestyle="--")
     plt.title("Comparación de espectros de voz (FFT)")
     plt.xlabel("Frecuencia [Hz]")
     plt.ylabel("Magnitud")
@@ -3,7 +3,7 @@ from routes.main_routes import main_bp
 from routes.voz_routes import voz_bp
 from routes.clave_routes import clave_bp
 from routes.graficos import graficos_bp
-import webbrowser, os
+import webbrowser, os, sys
 from threading import Timer
 
 def create_app():
@@ -24,6 +24,18 @@ def abrir_navegador():
 
 
 if __name__ == "__main__":
+    # python app.py --medir-arranque : informe de tiempos de importación
+    if "--medir-arranque" in sys.argv:
+        from utils.perfil_arranque import medir_arranque
+        medir_arranque()
+        sys.exit(0)
+
+    # python app.py --prerenderizar : genera los gráficos de todos los audios
+    if "--prerenderizar" in sys.argv:
+        from services.graficos_service import prerenderizar
+        print(prerenderizar())
+        sys.exit(0)
+
     # Abrir navegador 1 segundo después de iniciar el servidor
     Timer(1, abrir_navegador).start()
     app.run(debug=True, use_reloader=False)
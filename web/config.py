@@ -6,12 +6,90 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 VOCES_AUTORIZADAS = os.path.join(DATA_DIR, "voces_autorizadas")
 VERIFICACIONES = os.path.join(DATA_DIR, "verificaciones")
-HISTORIAL_JSON = os.path.join(DATA_DIR, "historial.json")
+HISTORIAL_JSON = os.path.join(DATA_DIR, "historial.json")   # formato viejo, se migra solo
 CLAVE_FILE = os.path.join(DATA_DIR, "clave.txt")
-VOCES_JSON = os.path.join(DATA_DIR, "voces.json")
+VOCES_JSON = os.path.join(DATA_DIR, "voces.json")   # manifiesto del snapshot de voces registradas
+
+# Guardar una copia (.webm + .wav) de cada intento de verificación.
+# La verificación en sí no necesita archivos.
+GUARDAR_VERIFICACIONES = True
+
+# Pool de conversiones con ffmpeg
+FFMPEG_WORKERS = min(4, os.cpu_count() or 1)   # conversiones simultáneas
+FFMPEG_TIMEOUT = 20                            # segundos máximos por conversión
+FFMPEG_COLA = 32                               # conversiones en espera
+
+# Verificación asíncrona (pool de procesos)
+TAREAS_WORKERS = os.cpu_count() or 1
+TAREAS_TTL = 300   # segundos que se guarda el resultado de una tarea
+
+# Preselección de candidatos: solo los K más parecidos por MFCC
+# (y a no más de MARGEN del mejor) reciben el score completo
+PRESELECCION_K = 10
+PRESELECCION_MARGEN = 0.3
+
+# Verificación en vivo (fragmentos mientras el usuario habla)
+STREAM_MARGEN = 0.15          # decide antes si el score se aleja de UMBRAL por este margen
+STREAM_MIN_SEG = 1.0          # segundos mínimos de audio para aceptar antes de tiempo
+STREAM_MIN_SEG_RECHAZO = 2.0  # segundos mínimos de audio para rechazar antes de tiempo
+STREAM_TTL = 60               # segundos de vida de una sesión abandonada
+STREAM_MAX_SESIONES = 16      # sesiones abiertas a la vez
+STREAM_MAX_SEG = 15.0         # segundos de audio con los que se decide sin esperar el fin
+STREAM_MAX_BYTES = 1 << 20    # webm recibido como máximo por sesión (más = 413)
+
+# Cache de audio decodificado y características (por hash de contenido)
+CACHE_MEMORIA_MB = 256
+CACHE_DISCO_MB = 0      # 0 = sin cache en disco
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+# Historial de eventos
+HISTORIAL_LOG = os.path.join(DATA_DIR, "historial.jsonl")   # un evento por línea
+HISTORIAL_IDX = os.path.join(DATA_DIR, "historial.idx")     # offset/fecha/tipo de cada línea
+HISTORIAL_POR_PAGINA = 50
+
+# Dónde se guarda el historial: "jsonl" (archivo por líneas) o "sqlite"
+HISTORIAL_BACKEND = "jsonl"
+HISTORIAL_DB = os.path.join(DATA_DIR, "historial.db")
+
+# Contadores del historial actualizados en cada escritura (para dashboards)
+HISTORIAL_STATS = os.path.join(DATA_DIR, "historial_stats.json")
+HISTORIAL_STATS_HORAS = 24 * 7   # horas que se conservan en el detalle por hora
+
+# Rotación del historial: el log vivo pasa a un segmento .jsonl.gz al superar
+# el tamaño o la antigüedad; los segmentos se borran pasada la retención
+HISTORIAL_ARCHIVO_DIR = os.path.join(DATA_DIR, "historial_archivo")
+HISTORIAL_ROTAR_MB = 5
+HISTORIAL_ROTAR_DIAS = 30
+HISTORIAL_RETENCION_DIAS = 730   # 0 = conservar para siempre
+
+# Escritura del historial en segundo plano (por lotes)
+HISTORIAL_LOTE = 100           # eventos que disparan una escritura
+HISTORIAL_FLUSH_SEG = 1.0      # espera máxima antes de escribir lo pendiente
+HISTORIAL_COLA_MAX = 10000     # eventos pendientes como máximo
+HISTORIAL_DESBORDE = "escribir"   # cola llena: "escribir" (lo hace la petición) o "descartar"
+
+# Índice de características precalculadas de las voces registradas
+INDICE_VOCES = os.path.join(DATA_DIR, "indice_voces")
+
+# Índice aproximado de vecinos (IVF) para muchas voces registradas
+INDICE_ANN = os.path.join(DATA_DIR, "indice_ann.npz")
+ANN_MIN_VOCES = 500   # desde cuántas voces se usa en vez de la preselección exacta
+ANN_LISTAS = 64       # grupos de k-means
+ANN_NPROBE = 8        # grupos revisados por búsqueda (más = mejor recall, más lento)
+
+# Referencias en memoria cuantizadas (señal int16, FFT/MFCC int8 por dimensión)
+CUANTIZAR_REFERENCIAS = True
 
 # Carpeta de estáticos para imágenes generadas
 STATIC_FOLDER = os.path.join(BASE_DIR, "static")
+RENDER_MAX_CARPETAS = 200   # carpetas de gráficos en static/ antes de borrar las menos usadas
+GRAFICOS_WORKERS = min(3, os.cpu_count() or 1)   # procesos que dibujan (una figura cada uno)
+
+# Pirámide de teselas del espectrograma (zoom y desplazamiento)
+TESELAS_DIR = os.path.join(DATA_DIR, "teselas")
+TESELA_ANCHO = 256         # frames de STFT por tesela
+TESELA_FILAS = 256         # bandas de frecuencia (logarítmicas)
+TESELAS_MAX_AUDIOS = 50    # pirámides guardadas antes de borrar las menos usadas
 
 # Carpeta de audios a graficar (puede ser la misma que VOCES_AUTORIZADAS)
 VOCES_FOLDER = os.path.join(BASE_DIR, "voces")
@@ -20,7 +98,7 @@ VOCES_FOLDER = os.path.join(BASE_DIR, "voces")
 PDFS_FOLDER = os.path.join(STATIC_FOLDER, "pdfs")
 
 # Crear carpetas si no existen
-for carpeta in [VOCES_AUTORIZADAS, VERIFICACIONES, STATIC_FOLDER, VOCES_FOLDER]:
+for carpeta in [VOCES_AUTORIZADAS, VERIFICACIONES, INDICE_VOCES, STATIC_FOLDER, VOCES_FOLDER]:
     os.makedirs(carpeta, exist_ok=True)
 
 
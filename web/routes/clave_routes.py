@@ -1,6 +1,7 @@
-from flask import Blueprint, render_template, redirect, url_for
+from flask import Blueprint, render_template, redirect, request, url_for
 from utils.historial import registrar_evento_json
-from utils.historial import leer_historial_json
+from utils.historial import consultar_historial, borrar_historial as vaciar_historial, TIPOS
+from config import HISTORIAL_POR_PAGINA
 
 clave_bp = Blueprint("clave", __name__)
 
@@ -39,20 +40,28 @@ def registrar():
 
 @clave_bp.route("/historial")
 def historial():
-    registros = leer_historial_json()
+    tipo = request.args.get("tipo") or None
+    desde = request.args.get("desde") or None
+    hasta = request.args.get("hasta") or None
+    pagina = max(request.args.get("pagina", 1, type=int), 1)
+
+    registros, total = consultar_historial(pagina, tipo=tipo, desde=desde, hasta=hasta)
     registros_texto = [
         f"{r.get('fecha')} | {r.get('tipo')} | {r.get('evento')}"
-        for r in registros[::-1]
+        for r in registros
     ]
-    return render_template("historial.html", registros=registros_texto)
+    return render_template(
+        "historial.html",
+        registros=registros_texto,
+        pagina=pagina,
+        paginas=max(1, -(-total // HISTORIAL_POR_PAGINA)),
+        total=total,
+        tipos=TIPOS,
+        filtros={"tipo": tipo or "", "desde": desde or "", "hasta": hasta or ""}
+    )
 
 @clave_bp.route('/borrar_historial', methods=["POST"])
 def borrar_historial():
-    import json
-    from config import HISTORIAL_JSON
-
-    with open(HISTORIAL_JSON, "w", encoding="utf-8") as f:
-        json.dump([], f)
-
+    vaciar_historial()
     registrar_evento_json("Historial borrado por el usuario", tipo="ACCION")
     return redirect(url_for("main.historial"))
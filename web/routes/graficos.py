@@ -1,10 +1,19 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response
 import os
-from services.graficos_service import generar_graficos
 import config
 
 graficos_bp = Blueprint('graficos', __name__)
 
+
+def _ruta_audio(archivo):
+    """Ruta completa del audio (voces registradas o verificaciones), o None."""
+    archivo = os.path.basename(archivo)
+    for carpeta in (config.VOCES_AUTORIZADAS, config.VERIFICACIONES):
+        if os.path.exists(os.path.join(carpeta, archivo)):
+            return os.path.join(carpeta, archivo)
+    return None
+
+
 @graficos_bp.route('/graficar_voz', methods=['POST'])
 def graficar_voz():
     data = request.get_json()
@@ -13,23 +22,74 @@ def graficar_voz():
     if not archivo:
         return jsonify({"error": "No se especificó un archivo"}), 400
 
-    # Ruta completa del audio
-    if os.path.exists(os.path.join(config.VOCES_AUTORIZADAS, archivo)):
-        path_audio = os.path.join(config.VOCES_AUTORIZADAS, archivo)
-    elif os.path.exists(os.path.join(config.VERIFICACIONES, archivo)):
-        path_audio = os.path.join(config.VERIFICACIONES, archivo)
-    else:
+    path_audio = _ruta_audio(archivo)
+    if path_audio is None:
         return jsonify({"error": "Archivo no encontrado"}), 404
 
+    # Modo datos: arreglos reducidos para dibujar en el navegador
+    if data.get('modo') == 'datos':
+        from services.datos_graficos_service import datos_graficos
+        return jsonify(datos_graficos(path_audio))
+
     # Carpeta de salida de imágenes dentro de static/
     nombre_carpeta = os.path.splitext(archivo)[0]
     carpeta_salida = os.path.join(config.STATIC_FOLDER, nombre_carpeta)
 
+    # Importación diferida: matplotlib y librosa solo cuando se grafica
+    from services.graficos_service import generar_graficos
     rutas = generar_graficos(path_audio, carpeta_salida)
 
-    # Rutas relativas para el frontend
+    # Rutas relativas para el frontend; ?v= cambia si cambia el audio,
+    # así el navegador puede cachear las imágenes sin preguntar
+    v = "?v=" + rutas["clave"]
     return jsonify({
-        "onda": os.path.join(nombre_carpeta, "senal.png"),
-        "fft": os.path.join(nombre_carpeta, "fft.png"),
-        "spec": os.path.join(nombre_carpeta, "espectrograma.png")
+        "onda": os.path.join(nombre_carpeta, "senal.png") + v,
+        "fft": os.path.join(nombre_carpeta, "fft.png") + v,
+        "spec": os.path.join(nombre_carpeta, "espectrograma.png") + v
     })
+
+
+# =======================================================
+# Teselas del espectrograma (zoom y desplazamiento)
+# =======================================================
+@graficos_bp.route('/espectrograma/teselas/<archivo>')
+def espectrograma_teselas(archivo):
+    path_audio = _ruta_audio(archivo)
+    if path_audio is None:
+        return jsonify({"error": "Archivo no encontrado"}), 404
+
+    from services.teselas_service import info_teselas
+    return jsonify(info_teselas(path_audio))
+
+
+@graficos_bp.route('/espectrograma/tesela/<archivo>/<int:nivel>/<int:x>')
+def espectrograma_tesela(archivo, nivel, x):
+    """Tesela en crudo: uint8 de X-Frames filas por X-Filas bandas."""
+    path_audio = _ruta_audio(archivo)
+    if path_audio is None:
+        return jsonify({"error": "Archivo no encontrado"}), 404
+
+    from services.teselas_service import tesela
+    datos = tesela(path_audio, nivel, x)
+    if datos is None:
+        return jsonify({"error": "Tesela fuera de rango"}), 404
+
+    respuesta = Response(datos.tobytes(), mimetype="application/octet-stream")
+    respuesta.headers["X-Frames"] = str(datos.shape[0])
+    respuesta.headers["X-Filas"] = str(datos.shape[1])
+    if "v" in request.args:
+        respuesta.cache_control.public = True
+        respuesta.cache_control.max_age = 31536000
+        respuesta.cache_control.immutable = True
+    return respuesta
+
+
+@graficos_bp.after_app_request
+def cache_imagenes(respuesta):
+    """Las imágenes pedidas con ?v= no cambian nunca: caché larga en el navegador."""
+    if request.endpoint == "static" and "v" in request.args and respuesta.status_code == 200:
+        respuesta.cache_control.no_cache = None
+        respuesta.cache_control.public = True
+        respuesta.cache_control.max_age = 31536000
+        respuesta.cache_control.immutable = True
+    return respuesta
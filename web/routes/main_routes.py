@@ -1,10 +1,11 @@
 from flask import Blueprint, render_template, redirect, request, url_for, flash, jsonify
 from utils.historial import registrar_evento_json
-from utils.historial import leer_historial_json
+from utils.historial import consultar_historial, borrar_historial as vaciar_historial, TIPOS
+from utils.historial import estadisticas_historial, resumen_historial
 import os
 from werkzeug.utils import secure_filename
 from urllib.parse import quote
-from config import PDFS_FOLDER, CLAVE_FILE
+from config import PDFS_FOLDER, CLAVE_FILE, HISTORIAL_POR_PAGINA
 
 main_bp = Blueprint("main", __name__)
 
@@ -43,24 +44,43 @@ def registrar():
 
 @main_bp.route("/historial")
 def historial():
-    registros = leer_historial_json()
+    tipo = request.args.get("tipo") or None
+    desde = request.args.get("desde") or None
+    hasta = request.args.get("hasta") or None
+    pagina = max(request.args.get("pagina", 1, type=int), 1)
+
+    registros, total = consultar_historial(pagina, tipo=tipo, desde=desde, hasta=hasta)
     registros_texto = [
         f"{r.get('fecha')} | {r.get('tipo')} | {r.get('evento')}"
-        for r in registros[::-1]
+        for r in registros
     ]
-    return render_template("historial.html", registros=registros_texto)
+    return render_template(
+        "historial.html",
+        registros=registros_texto,
+        pagina=pagina,
+        paginas=max(1, -(-total // HISTORIAL_POR_PAGINA)),
+        total=total,
+        tipos=TIPOS,
+        filtros={"tipo": tipo or "", "desde": desde or "", "hasta": hasta or ""}
+    )
 
 @main_bp.route('/borrar_historial', methods=["POST"])
 def borrar_historial():
-    import json
-    from config import HISTORIAL_JSON
-
-    with open(HISTORIAL_JSON, "w", encoding="utf-8") as f:
-        json.dump([], f)
-
+    vaciar_historial()
     registrar_evento_json("Historial borrado por el usuario", tipo="ACCION")
     return redirect(url_for("main.historial"))
 
+@main_bp.route("/historial/estadisticas")
+def historial_estadisticas():
+    stats = estadisticas_historial()
+    if stats is None:
+        return jsonify({"error": "Las estadísticas requieren HISTORIAL_BACKEND = 'sqlite'"}), 501
+    return jsonify(stats)
+
+@main_bp.route("/historial/resumen")
+def historial_resumen():
+    return jsonify(resumen_historial())
+
 @main_bp.route('/agregar_pdf', methods=['POST'])
 def agregar_pdf():
     archivo = request.files.get('archivo')
@@ -1,11 +1,13 @@
 from flask import Blueprint, request, jsonify
-from services.voz_service import procesar_registro_voz, procesar_verificacion_voz, listar_voces
 from utils.historial import registrar_evento_json
 
+# Los servicios de audio (numpy, librosa, ffmpeg) se importan dentro de
+# cada ruta: así el arranque no paga esas importaciones.
 voz_bp = Blueprint("voz", __name__)
 
 @voz_bp.route("/listar_voces")
 def listar():
+    from services.voz_service import listar_voces
     return jsonify(listar_voces())
 
 @voz_bp.route("/guardar_voz", methods=["POST"])
@@ -14,6 +16,7 @@ def guardar_voz():
     if not archivo:
         return jsonify({"mensaje":"❌ No se envió audio."}), 400
 
+    from services.voz_service import procesar_registro_voz
     mensaje = procesar_registro_voz(archivo)
     registrar_evento_json("Se guardó un nuevo audio (voz_registrada.wav)", tipo="ACCESO")
 
@@ -25,6 +28,7 @@ def agregar_voz():
     if not archivo:
         return "❌ No se subió ningún archivo.", 400
 
+    from services.voz_service import procesar_registro_voz
     return procesar_registro_voz(archivo, es_agregar=True)
 
 @voz_bp.route("/verificar_voz", methods=["POST"])
@@ -33,4 +37,64 @@ def verificar_voz():
     if not archivo:
         return jsonify({"error":"No se recibió audio"}), 400
 
+    from services.voz_service import procesar_verificacion_voz
     return procesar_verificacion_voz(archivo)
+
+@voz_bp.route("/verificar_voz_async", methods=["POST"])
+def verificar_voz_async():
+    archivo = request.files.get("audio")
+    if not archivo:
+        return jsonify({"error":"No se recibió audio"}), 400
+
+    from services.voz_service import encolar_verificacion_voz
+    id_tarea = encolar_verificacion_voz(archivo)
+    return jsonify({"id": id_tarea, "estado": "pendiente"}), 202
+
+@voz_bp.route("/verificar_voz/estado/<id_tarea>")
+def verificar_voz_estado(id_tarea):
+    from services.tareas_service import estado_tarea
+    tarea = estado_tarea(id_tarea)
+    if tarea is None:
+        return jsonify({"error":"Tarea no encontrada"}), 404
+
+    if tarea["estado"] == "pendiente":
+        return jsonify({"estado": "pendiente"}), 202
+
+    codigo = 500 if "error" in tarea["resultado"] else 200
+    return jsonify(tarea["resultado"]), codigo
+
+@voz_bp.route("/estadisticas_cache")
+def estadisticas_cache():
+    from utils.cache import cache_audio
+    return jsonify(cache_audio.estadisticas())
+
+@voz_bp.route("/verificar_stream", methods=["POST"])
+def verificar_stream_iniciar():
+    from services.stream_service import iniciar_stream
+    id_sesion = iniciar_stream()
+    if id_sesion is None:
+        return jsonify({"error":"Demasiadas verificaciones en curso"}), 503
+    return jsonify({"id": id_sesion}), 201
+
+@voz_bp.route("/verificar_stream/<id_sesion>", methods=["POST"])
+def verificar_stream_fragmento(id_sesion):
+    from services.stream_service import agregar_fragmento
+    estado = agregar_fragmento(id_sesion, request.get_data())
+    if estado is None:
+        return jsonify({"error":"Sesión no encontrada"}), 404
+    codigo = 413 if "error" in estado else 200
+    return jsonify(estado), codigo
+
+@voz_bp.route("/verificar_stream/<id_sesion>/fin", methods=["POST"])
+def verificar_stream_fin(id_sesion):
+    from services.stream_service import finalizar_stream
+    estado = finalizar_stream(id_sesion)
+    if estado is None:
+        return jsonify({"error":"Sesión no encontrada"}), 404
+    codigo = 500 if "error" in estado else 200
+    return jsonify(estado), codigo
+
+@voz_bp.route("/indice/cuantizacion")
+def indice_cuantizacion():
+    from services.indice_service import informe_cuantizacion
+    return jsonify(informe_cuantizacion())
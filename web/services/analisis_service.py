@@ -0,0 +1,109 @@
+# services/analisis_service.py
+#
+# Análisis de un audio en una sola pasada: se decodifica una vez, se
+# calcula una sola STFT y de ahí salen el espectro, el espectrograma y los
+# MFCC (más la envolvente y el resumen, que salen de la señal). Gráficos,
+# modo datos, teselas y verificación usan este mismo resultado.
+
+from collections import namedtuple
+
+import numpy as np
+
+from services.audio_service import cargar_audio
+from utils.audio_features import stft_magnitud, mfcc_desde_stft, espectrograma_db
+from utils.cache import cache_audio, hash_archivo
+from utils.decimado import envolvente
+
+N_FFT = 2048      # parámetros de librosa.stft por defecto
+HOP = 512
+PUNTOS = 2000     # columnas min/max de la envolvente
+N_MFCC = 20
+MAX_PICOS = 10
+VERSION = 1       # se incrementa si cambia el cálculo (cambia la clave del cache)
+
+Analisis = namedtuple("Analisis", [
+    "sr", "duracion",
+    "onda_x", "onda_y",          # envolvente min/max (x en muestras)
+    "freqs", "espectro",         # magnitud media de la STFT por bin
+    "S_dB",                      # espectrograma en dB (ref = máximo)
+    "mfcc",                      # MFCC promediados y normalizados
+    "rms", "zcr", "amplitud_max", "f_dominante",
+    "picos",                     # (k, 2): frecuencia, magnitud
+])
+
+
+def _picos(freqs, espectro):
+    """Picos de al menos el 20% del máximo, de menor a mayor frecuencia."""
+    from scipy.signal import find_peaks
+    idx, _ = find_peaks(espectro, height=espectro.max(initial=0) * 0.2)
+    idx = idx[:MAX_PICOS]
+    return np.column_stack((freqs[idx], espectro[idx])).astype(np.float32)
+
+
+def analizar_senal(y, sr):
+    """Análisis completo de una señal ya decodificada (sin cache)."""
+    y = np.asarray(y, dtype=np.float32)
+    S = stft_magnitud(y, N_FFT, HOP)
+
+    freqs = np.fft.rfftfreq(N_FFT, 1 / sr).astype(np.float32)
+    espectro = np.sqrt((S ** 2).mean(axis=1))
+    onda_x, onda_y = envolvente(y, puntos=PUNTOS)
+    duracion = len(y) / sr
+
+    return Analisis(
+        sr=int(sr),
+        duracion=duracion,
+        onda_x=onda_x,
+        onda_y=onda_y,
+        freqs=freqs,
+        espectro=espectro,
+        S_dB=espectrograma_db(y, S),
+        mfcc=mfcc_desde_stft(S, sr, N_MFCC),
+        rms=float(np.sqrt(np.mean(y.astype(np.float64) ** 2))) if len(y) else 0.0,
+        zcr=float(np.count_nonzero(np.diff(np.signbit(y)))) / duracion if len(y) else 0.0,   # cruces/s
+        amplitud_max=float(np.abs(y).max(initial=0)),
+        f_dominante=float(freqs[np.argmax(espectro)]),
+        picos=_picos(freqs, espectro),
+    )
+
+
+def _clave(path_audio):
+    return f"analisis-v{VERSION}-nativo-{hash_archivo(path_audio)}"
+
+
+def analizar(path_audio):
+    """
+    Análisis de un archivo a su frecuencia original. Queda en el cache por
+    hash de contenido: todos los consumidores del mismo audio comparten una
+    sola decodificación y una sola STFT.
+    """
+    def _calcular():
+        y, sr = cargar_audio(path_audio, sr=None)
+        return None if y is None else analizar_senal(y, sr)
+
+    r = cache_audio.calcular(_clave(path_audio), _calcular)
+    if r is None:
+        raise ValueError(f"No se pudo leer {path_audio}")
+    return Analisis._make(r)   # desde disco vuelve como tupla simple
+
+
+def recordar(path_audio, a):
+    """
+    Deja en el cache el análisis de un .wav recién escrito a partir del PCM
+    con el que se escribió (registro, verificación archivada): graficarlo
+    después no lo vuelve a decodificar ni a transformar.
+    """
+    cache_audio.guardar(_clave(path_audio), a)
+
+
+def resumen(a):
+    """Resumen del análisis en tipos de JSON."""
+    return {
+        "sr": a.sr,
+        "duracion": round(float(a.duracion), 3),
+        "rms": round(float(a.rms), 6),
+        "amplitud_max": round(float(a.amplitud_max), 6),
+        "zcr": round(float(a.zcr), 2),
+        "f_dominante": round(float(a.f_dominante), 1),
+        "picos": [[round(float(f), 1), round(float(m), 3)] for f, m in a.picos],
+    }
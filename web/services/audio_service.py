@@ -1,21 +1,30 @@
-import subprocess
-import librosa
 import numpy as np
 
-def convertir_webm_a_wav(entrada, salida):
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", entrada,
-        "-ar", "16000",
-        "-ac", "1",
-        salida
-    ]
-    subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+from services.transcodificador import obtener_pool
+from utils.cache import cache_audio, hash_archivo
 
-def cargar_audio(path):
+def decodificar_audio(datos, sr=16000):
+    """
+    Decodifica bytes de audio (webm, wav, mp3...) a PCM mono float32.
+    ffmpeg lee de stdin y escribe PCM crudo a stdout: no usa archivos.
+    Las conversiones pasan por el pool compartido (concurrencia y timeout).
+    """
+    return obtener_pool().decodificar(datos, sr)
+
+def guardar_wav(path, y, sr):
+    """Escribe PCM float a WAV 16 bits (mismo formato que generaba ffmpeg)."""
+    import soundfile as sf
+    sf.write(path, y, sr, subtype="PCM_16")
+
+def cargar_audio(path, sr=16000):
+    """
+    Carga un audio a `sr` (None = frecuencia original). El resultado queda
+    en el cache por hash de contenido, así releer el mismo archivo es gratis.
+    """
+    import librosa  # importación diferida (librosa tarda en cargar)
     try:
-        y, sr = librosa.load(path, sr=16000)
-        return y, sr
+        clave = f"pcm-{sr or 'nativo'}-{hash_archivo(path)}"
+        return cache_audio.calcular(clave, lambda: librosa.load(path, sr=sr))
     except:
         return None, None
 
@@ -0,0 +1,89 @@
+# services/datos_graficos_service.py
+#
+# Modo datos de /graficar_voz: en vez de PNG hechos con matplotlib se
+# devuelven los arreglos ya reducidos y el navegador los dibuja.
+
+import json
+import base64
+import numpy as np
+
+from services.analisis_service import analizar, resumen, VERSION as VERSION_ANALISIS
+from utils.cache import cache_audio, hash_archivo
+from utils.decimado import envolvente
+
+PUNTOS_ONDA = 1000       # columnas min/max de la forma de onda
+BANDAS_FFT = 256         # bandas logarítmicas del espectro
+FILAS_SPEC = 128         # bandas (log) del espectrograma
+COLUMNAS_SPEC = 400      # columnas de tiempo del espectrograma
+DB_MIN = -80.0           # el espectrograma va en uint8 de DB_MIN a 0 dB
+
+
+def bandas_log(n, f_max, bandas, f_min=20.0):
+    """Inicio (índice de bin) de cada banda logarítmica no vacía entre f_min y f_max."""
+    bordes_hz = np.geomspace(f_min, f_max, bandas + 1)[:-1]
+    bordes = np.unique(np.round(bordes_hz / f_max * (n - 1)).astype(int))
+    return bordes[bordes < n]
+
+
+def _fft_log(freqs, mag, sr):
+    bordes = bandas_log(len(mag), sr / 2, BANDAS_FFT)
+    # El máximo de cada banda conserva los picos (formantes, armónicos)
+    return freqs[bordes], np.maximum.reduceat(mag, bordes)
+
+
+def _espectrograma_reducido(S_dB, sr):
+    bordes = bandas_log(S_dB.shape[0], sr / 2, FILAS_SPEC)
+    S = np.maximum.reduceat(S_dB, bordes, axis=0)
+
+    columnas = min(COLUMNAS_SPEC, S.shape[1])
+    cortes = np.linspace(0, S.shape[1], columnas + 1).astype(int)[:-1]
+    S = np.maximum.reduceat(S, cortes, axis=1)
+
+    q = np.clip((S - DB_MIN) / -DB_MIN * 255, 0, 255).astype(np.uint8)
+    frecuencias = bordes * (sr / 2) / (S_dB.shape[0] - 1)
+    return frecuencias, q
+
+
+def _calcular(a):
+    # La envolvente del análisis ya es min/max: reducirla de nuevo es exacto
+    t, onda = envolvente(a.onda_y, a.onda_x / a.sr, puntos=PUNTOS_ONDA)
+    freqs, mag = _fft_log(a.freqs, a.espectro, a.sr)
+    freqs_spec, spec = _espectrograma_reducido(a.S_dB, a.sr)
+    return (
+        t.astype(np.float32), onda.astype(np.float32),
+        freqs.astype(np.float32), mag.astype(np.float32),
+        freqs_spec.astype(np.float32), spec,
+        np.float64(a.sr), np.float64(a.duracion), json.dumps(resumen(a)),
+    )
+
+
+def datos_graficos(path_audio):
+    """
+    Onda (envolvente min/max), FFT en bandas logarítmicas y espectrograma
+    reducido en dB (uint8, base64), listos para dibujar en el navegador,
+    más el resumen del análisis (RMS, ZCR, frecuencia dominante, picos).
+    """
+    clave = (
+        f"datos-v{VERSION_ANALISIS}-{hash_archivo(path_audio)}"
+        f"-{PUNTOS_ONDA}-{BANDAS_FFT}-{FILAS_SPEC}-{COLUMNAS_SPEC}"
+    )
+    # El análisis completo (con el espectrograma entero) solo se pide si
+    # los datos reducidos no están en el cache
+    r = cache_audio.calcular(clave, lambda: _calcular(analizar(path_audio)))
+    t, onda, freqs, mag, freqs_spec, spec, sr, duracion, info = r
+
+    return {
+        "sr": int(sr),
+        "duracion": float(duracion),
+        "resumen": json.loads(info),
+        "onda": {"t": np.round(t, 4).tolist(), "y": np.round(onda, 4).tolist()},
+        "fft": {"f": np.round(freqs, 1).tolist(), "mag": np.round(mag, 3).tolist()},
+        "espectrograma": {
+            "filas": int(spec.shape[0]),
+            "columnas": int(spec.shape[1]),
+            "f": np.round(freqs_spec, 1).tolist(),
+            "db_min": DB_MIN,
+            "db_max": 0.0,
+            "datos": base64.b64encode(spec.tobytes()).decode("ascii"),   # filas x columnas, uint8
+        },
+    }
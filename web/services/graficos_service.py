@@ -1,65 +1,223 @@
 # services/graficos_service.py
 
 import os
-import numpy as np
-import librosa
-import matplotlib.pyplot as plt
-
-def graficar_senal(y, sr, salida):
-    plt.figure(figsize=(10, 3))
-    plt.plot(y)
-    plt.title("Señal de audio")
-    plt.xlabel("Muestras")
-    plt.ylabel("Amplitud")
-    plt.tight_layout()
-    plt.savefig(salida)
-    plt.close()
-
-
-def graficar_fft(y, sr, salida):
-    N = len(y)
-    fft = np.abs(np.fft.rfft(y))
-    freqs = np.fft.rfftfreq(N, 1/sr)
-
-    plt.figure(figsize=(10, 3))
-    plt.plot(freqs, fft)
-    plt.title("Espectro FFT")
-    plt.xlabel("Frecuencia (Hz)")
-    plt.ylabel("Magnitud")
-    plt.tight_layout()
-    plt.savefig(salida)
-    plt.close()
-
-
-def graficar_espectrograma(y, sr, salida):
-    S = np.abs(librosa.stft(y))
-    S_dB = librosa.amplitude_to_db(S, ref=np.max)
-
-    plt.figure(figsize=(10, 4))
-    librosa.display.specshow(S_dB, sr=sr, x_axis='time', y_axis='log')
-    plt.title("Espectrograma")
-    plt.colorbar(format='%+2.0f dB')
-    plt.tight_layout()
-    plt.savefig(salida)
-    plt.close()
+import json
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from services.analisis_service import analizar, PUNTOS, VERSION as VERSION_ANALISIS
+from utils.cache import hash_archivo
+from config import (
+    STATIC_FOLDER, RENDER_MAX_CARPETAS, GRAFICOS_WORKERS,
+    VOCES_AUTORIZADAS, VERIFICACIONES
+)
+
+# Parámetros de dibujo: si cambian, las imágenes guardadas dejan de valer
+PARAMETROS = {
+    "version": 2,     # 2: espectro sacado de la STFT compartida
+    "senal": (10, 3),
+    "fft": (10, 3),
+    "espectrograma": (10, 4),
+    "puntos": PUNTOS,   # columnas min/max de la onda (~2 por píxel)
+    "analisis": VERSION_ANALISIS,
+}
+
+MANIFIESTO = ".render.json"
+
+
+# =======================================================
+# Dibujo (API orientada a objetos: Figure + Agg, sin pyplot)
+# =======================================================
+# Cada función arma su propia Figure, así pueden correr a la vez en
+# distintos procesos (o hilos) sin compartir el estado global de pyplot.
+def _nueva_figura(figsize):
+    import matplotlib
+    matplotlib.use("Agg")   # sin ventanas: librosa.display importa pyplot
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _guardar(fig, salida):
+    """Escribe a un temporal y reemplaza: nadie ve un PNG a medio escribir."""
+    fig.tight_layout()
+    tmp = salida + ".tmp.png"
+    fig.savefig(tmp)
+    os.replace(tmp, salida)
+
+
+def _figura_linea(x, y, salida, figsize, titulo, xlabel, ylabel):
+    fig = _nueva_figura(figsize)
+    ax = fig.add_subplot()
+    ax.plot(x, y)
+    ax.set_title(titulo)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    _guardar(fig, salida)
+
+
+def _figura_espectrograma(S_dB, sr, salida, figsize):
+    import librosa.display
+
+    fig = _nueva_figura(figsize)
+    ax = fig.add_subplot()
+    img = librosa.display.specshow(S_dB, sr=sr, x_axis='time', y_axis='log', ax=ax)
+    ax.set_title("Espectrograma")
+    fig.colorbar(img, ax=ax, format='%+2.0f dB')
+    _guardar(fig, salida)
+
+
+# =======================================================
+# Pool de procesos para dibujar
+# =======================================================
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=GRAFICOS_WORKERS)
+        return _pool
+
+
+# =======================================================
+# Cache de imágenes (por hash del audio + parámetros)
+# =======================================================
+def _clave_render(path_audio):
+    parametros = json.dumps(PARAMETROS, sort_keys=True).encode()
+    return f"{hash_archivo(path_audio)[:16]}-{hashlib.sha1(parametros).hexdigest()[:8]}"
+
+
+def _render_vigente(carpeta_salida, outs, clave):
+    manifiesto = os.path.join(carpeta_salida, MANIFIESTO)
+    try:
+        with open(manifiesto, "r", encoding="utf-8") as f:
+            if json.load(f).get("clave") != clave:
+                return False
+    except (OSError, ValueError):
+        return False
+    if not all(os.path.exists(p) for p in outs.values()):
+        return False
+    os.utime(manifiesto)   # marca de uso para la poda
+    return True
+
+
+def _podar_renders():
+    """Deja como mucho RENDER_MAX_CARPETAS carpetas de gráficos (borra las menos usadas)."""
+    carpetas = []
+    for e in os.scandir(STATIC_FOLDER):
+        manifiesto = os.path.join(e.path, MANIFIESTO)
+        if e.is_dir() and os.path.exists(manifiesto):
+            carpetas.append((os.path.getmtime(manifiesto), e.path))
+
+    carpetas.sort()
+    for _, path in carpetas[:max(len(carpetas) - RENDER_MAX_CARPETAS, 0)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+_carpetas_lock = threading.Lock()
+_carpetas = {}   # carpeta de salida -> Lock (un render a la vez por carpeta)
+
+
+def _lock_carpeta(carpeta):
+    with _carpetas_lock:
+        return _carpetas.setdefault(carpeta, threading.Lock())
 
 
 def generar_graficos(path_audio: str, carpeta_salida: str):
     """
-    Carga audio, genera sus gráficos y devuelve rutas de salida.
+    Carga audio, genera sus gráficos y devuelve rutas de salida (y la
+    clave del render, para versionar las URLs). Si las imágenes ya
+    existen para el mismo audio y parámetros no se decodifica ni dibuja.
+    Las tres figuras se dibujan a la vez en el pool de procesos.
     """
-    os.makedirs(carpeta_salida, exist_ok=True)
-
-    y, sr = librosa.load(path_audio, sr=None)
-
     outs = {
         "senal": os.path.join(carpeta_salida, "senal.png"),
         "fft": os.path.join(carpeta_salida, "fft.png"),
         "espectrograma": os.path.join(carpeta_salida, "espectrograma.png")
     }
+    clave = _clave_render(path_audio)
+    if _render_vigente(carpeta_salida, outs, clave):
+        return dict(outs, clave=clave)
+
+    # Si otra petición ya está dibujando esta carpeta, se espera y se reusa
+    with _lock_carpeta(carpeta_salida):
+        if _render_vigente(carpeta_salida, outs, clave):
+            return dict(outs, clave=clave)
+        _renderizar(path_audio, carpeta_salida, outs, clave)
+
+    _podar_renders()
+    return dict(outs, clave=clave)
+
+
+def _renderizar(path_audio, carpeta_salida, outs, clave):
+    os.makedirs(carpeta_salida, exist_ok=True)
+
+    # El análisis (una decodificación, una STFT) sale del cache si el archivo
+    # no cambió; a los procesos solo viajan las curvas ya reducidas y la
+    # matriz del espectrograma
+    a = analizar(path_audio)
+
+    pool = _obtener_pool()
+    futuros = [
+        pool.submit(_figura_linea, a.onda_x, a.onda_y, outs["senal"],
+                    PARAMETROS["senal"], "Señal de audio", "Muestras", "Amplitud"),
+        pool.submit(_figura_linea, a.freqs, a.espectro, outs["fft"],
+                    PARAMETROS["fft"], "Espectro FFT", "Frecuencia (Hz)", "Magnitud"),
+        pool.submit(_figura_espectrograma, a.S_dB, a.sr, outs["espectrograma"], PARAMETROS["espectrograma"]),
+    ]
+    for futuro in futuros:
+        futuro.result()
+
+    with open(os.path.join(carpeta_salida, MANIFIESTO), "w", encoding="utf-8") as f:
+        json.dump({"clave": clave, "audio": os.path.basename(path_audio)}, f)
+
+
+# =======================================================
+# Prerender masivo (calienta el cache de imágenes)
+# =======================================================
+def prerenderizar(carpetas=(VOCES_AUTORIZADAS, VERIFICACIONES)):
+    """
+    Genera los gráficos de todos los .wav de las carpetas (los que ya están
+    al día se saltean). Devuelve {"generados", "vigentes", "errores"}.
+    """
+    audios = [
+        os.path.join(carpeta, f)
+        for carpeta in carpetas if os.path.isdir(carpeta)
+        for f in sorted(os.listdir(carpeta)) if f.endswith(".wav")
+    ]
+    resumen = {"generados": 0, "vigentes": 0, "errores": 0}
+    lock = threading.Lock()
+
+    def uno(path_audio):
+        carpeta_salida = os.path.join(STATIC_FOLDER, os.path.splitext(os.path.basename(path_audio))[0])
+        vigente = os.path.exists(os.path.join(carpeta_salida, MANIFIESTO)) and _render_vigente(
+            carpeta_salida,
+            {n: os.path.join(carpeta_salida, n + ".png") for n in ("senal", "fft", "espectrograma")},
+            _clave_render(path_audio)
+        )
+        try:
+            generar_graficos(path_audio, carpeta_salida)
+            estado = "vigentes" if vigente else "generados"
+        except Exception as e:
+            print(f"❌ {path_audio}: {e}")
+            estado = "errores"
+        with lock:
+            resumen[estado] += 1
+
+    # Varios audios a la vez: el trabajo pesado ya va al pool de procesos
+    with ThreadPoolExecutor(max_workers=GRAFICOS_WORKERS) as hilos:
+        list(hilos.map(uno, audios))
+    return resumen
 
-    graficar_senal(y, sr, outs["senal"])
-    graficar_fft(y, sr, outs["fft"])
-    graficar_espectrograma(y, sr, outs["espectrograma"])
 
-    return outs
+if __name__ == "__main__":
+    # python -m services.graficos_service : prerender de todos los audios
+    print(prerenderizar())
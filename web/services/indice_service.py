@@ -0,0 +1,505 @@
+# services/indice_service.py
+
+import os
+import json
+import time
+import uuid
+import zipfile
+import tempfile
+import threading
+import numpy as np
+
+from config import (
+    VOCES_AUTORIZADAS, INDICE_VOCES, INDICE_ANN, VOCES_JSON,
+    ANN_MIN_VOCES, ANN_LISTAS, ANN_NPROBE,
+    PRESELECCION_K, PRESELECCION_MARGEN, CUANTIZAR_REFERENCIAS
+)
+
+from services.audio_service import cargar_audio
+from utils.audio_features import (
+    espectro_fft, mfcc_features, apilar_referencias, preseleccionar, puntuar_lote
+)
+from utils.indice_ann import IndiceIVF
+
+# Se incrementa cuando cambia la forma de calcular las características,
+# así los .npz viejos se recalculan solos.
+VERSION_INDICE = 3
+
+# Cache en memoria: nombre -> (mtime del .npz, características)
+_cache = {}
+
+# Indexado perezoso y publicación, uno a la vez por proceso (reentrante:
+# publicar_snapshot llama a cargar_indice y actualizar_indice a publicar_snapshot)
+_lock = threading.RLock()
+
+# Snapshot mapeado en memoria: (mtime del manifiesto, manifiesto, matrices)
+_snapshot = (None, None, None)
+SNAPSHOT_GRACIA_SEG = 60   # un snapshot más nuevo que esto no se borra (puede estar por publicarse)
+SNAPSHOT_REVISAR_SEG = 5   # cada cuánto se compara la huella completa de los .wav
+_revisado = (None, None, 0.0)   # (mtime del manifiesto, mtime de la carpeta, cuándo) de la última huella igual
+
+# Índice aproximado sobre los MFCC: (mtime del archivo, IndiceIVF)
+_ann = (None, None)
+_ann_pendientes = set()   # voces reindexadas sin publicar, para el próximo _sincronizar_ann
+
+
+def _reiniciar_en_hijo():
+    """Un hijo creado con fork hereda el lock, quizás tomado por otro hilo."""
+    global _lock
+    _lock = threading.RLock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+# =======================================================
+# Rutas
+# =======================================================
+def _ruta_indice(nombre_wav):
+    return os.path.join(INDICE_VOCES, os.path.splitext(nombre_wav)[0] + ".npz")
+
+
+# =======================================================
+# Cálculo de características de referencia
+# =======================================================
+def calcular_caracteristicas(y, sr, mfcc=None):
+    """
+    Características de una voz registrada, calculadas una sola vez.
+    Si ya se tienen los MFCC (del análisis compartido) se pasan en mfcc.
+    """
+    if mfcc is None:
+        mfcc = mfcc_features(y, sr)
+    return {
+        "senal": y.astype(np.float32),
+        "fft": espectro_fft(y).astype(np.float32),
+        "mfcc": np.asarray(mfcc, dtype=np.float32),
+        "sr": sr,
+    }
+
+
+def _guardar_npz(nombre_wav, feats):
+    """
+    Formato compacto: señal en int16 (con su escala) y FFT/MFCC en float16.
+    La correlación no depende de la escala, así que se puntúa tal cual.
+    """
+    os.makedirs(INDICE_VOCES, exist_ok=True)
+    destino = _ruta_indice(nombre_wav)
+
+    senal = feats["senal"]
+    pico = float(np.abs(senal).max(initial=0)) or 1.0
+
+    # Temporal propio en la misma carpeta: otro proceso puede estar
+    # indexando la misma voz a la vez
+    fd, tmp = tempfile.mkstemp(suffix=".tmp.npz", dir=INDICE_VOCES)
+    with os.fdopen(fd, "wb") as f:
+        np.savez(
+            f,
+            version=VERSION_INDICE,
+            senal=np.round(senal / pico * 32767).astype(np.int16),
+            escala_senal=pico / 32767,
+            fft=feats["fft"].astype(np.float16),
+            mfcc=feats["mfcc"].astype(np.float16),
+            sr=feats["sr"],
+        )
+    os.replace(tmp, destino)
+
+
+def actualizar_indice(nombre_wav, y=None, sr=None, publicar=True, mfcc=None):
+    """
+    Guarda las características de una voz registrada en el índice.
+    Se llama al guardar o agregar una voz; si ya se tiene el PCM
+    decodificado se pasa en y/sr y no se vuelve a leer el .wav
+    (y si ya se tienen sus MFCC, en mfcc).
+    Con publicar=True se genera un snapshot nuevo para todos los workers.
+    """
+    with _lock:
+        if y is None:
+            y, sr = cargar_audio(os.path.join(VOCES_AUTORIZADAS, nombre_wav))
+        if y is None:
+            return False
+
+        feats = calcular_caracteristicas(y, sr, mfcc)
+        _guardar_npz(nombre_wav, feats)
+        _cache.pop(nombre_wav, None)
+
+        # Alta (o reemplazo) en el índice aproximado. Sin publicar (indexado
+        # en lote desde cargar_indice) queda para _sincronizar_ann, que guarda
+        # una sola vez al final
+        if publicar:
+            ann = _obtener_ann()
+            ann.agregar(nombre_wav, feats["mfcc"])
+            _guardar_ann(ann)
+            publicar_snapshot()
+        else:
+            _ann_pendientes.add(nombre_wav)
+        return True
+
+
+# =======================================================
+# Lectura del índice
+# =======================================================
+def _leer_npz(nombre_wav):
+    path = _ruta_indice(nombre_wav)
+    mtime = os.path.getmtime(path)
+
+    en_cache = _cache.get(nombre_wav)
+    if en_cache and en_cache[0] == mtime:
+        return en_cache[1]
+
+    # Un .npz ilegible o a medias se trata como viejo: se vuelve a indexar
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != VERSION_INDICE:
+                return None
+            feats = {
+                "senal": data["senal"],
+                "escala_senal": float(data["escala_senal"]),
+                "fft": data["fft"],
+                "mfcc": data["mfcc"],
+                "sr": int(data["sr"]),
+            }
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        return None
+
+    _cache[nombre_wav] = (mtime, feats)
+    return feats
+
+
+def _vigente(nombre_wav):
+    """El .npz existe y es más nuevo que el .wav."""
+    path_idx = _ruta_indice(nombre_wav)
+    if not os.path.exists(path_idx):
+        return False
+    path_wav = os.path.join(VOCES_AUTORIZADAS, nombre_wav)
+    return os.path.getmtime(path_idx) >= os.path.getmtime(path_wav)
+
+
+def cargar_indice():
+    """
+    Devuelve {nombre_wav: características} para todas las voces registradas.
+    Las voces sin índice (o con índice viejo) se indexan en el momento,
+    así los .wav copiados a mano también funcionan.
+    """
+    with _lock:
+        indice = {}
+        nombres = sorted(f for f in os.listdir(VOCES_AUTORIZADAS) if f.endswith(".wav"))
+
+        for nombre in nombres:
+            feats = _leer_npz(nombre) if _vigente(nombre) else None
+            if feats is None:
+                if not actualizar_indice(nombre, publicar=False):
+                    continue
+                feats = _leer_npz(nombre)
+                if feats is None:
+                    continue
+            indice[nombre] = feats
+
+        # Limpiar entradas de voces que ya no existen
+        for nombre in list(_cache):
+            if nombre not in indice:
+                _cache.pop(nombre, None)
+
+        return indice
+
+
+def cargar_referencias():
+    """
+    Devuelve (nombres, matrices apiladas) listas para puntuar_lote.
+    Las matrices salen del snapshot mapeado en memoria: todos los workers
+    comparten la misma copia y solo se vuelve a mapear cuando se publica
+    una generación nueva.
+    """
+    snapshot = _vigente_snapshot()
+    if snapshot is None:
+        # publicar_snapshot deja mapeada la generación que acaba de escribir
+        publicar_snapshot()
+        snapshot = _snapshot
+
+    _, manifiesto, matrices = snapshot
+    return manifiesto["nombres"], matrices
+
+
+# =======================================================
+# Snapshot de voces registradas (un archivo por generación)
+# =======================================================
+def _ruta_snapshot(archivo):
+    return os.path.join(INDICE_VOCES, archivo)
+
+
+def _huella_voces():
+    """{nombre: [mtime_ns, tamaño]} de cada .wav: detecta altas, bajas y reescrituras."""
+    huella = {}
+    for e in os.scandir(VOCES_AUTORIZADAS):
+        if e.name.endswith(".wav"):
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            huella[e.name] = [st.st_mtime_ns, st.st_size]
+    return huella
+
+
+def _vigente_snapshot():
+    """
+    Snapshot actual (mtime, manifiesto, matrices), mapeando sus matrices si
+    cambió de generación. Devuelve None si no hay snapshot o si algún .wav
+    cambió desde que se publicó (ej. copiado, borrado o reescrito a mano).
+    La huella completa (un stat por .wav) solo se compara si cambió la
+    carpeta (altas y bajas) o pasaron SNAPSHOT_REVISAR_SEG (reescrituras).
+    """
+    global _snapshot, _revisado
+
+    try:
+        mtime = os.stat(VOCES_JSON).st_mtime_ns
+    except OSError:
+        return None
+
+    if _snapshot[0] != mtime:
+        try:
+            with open(VOCES_JSON, "r", encoding="utf-8") as f:
+                manifiesto = json.load(f)
+            if manifiesto.get("version") != VERSION_INDICE:
+                return None
+            matrices = _mapear(manifiesto)
+        except (OSError, ValueError, KeyError):
+            return None
+        _snapshot = (mtime, manifiesto, matrices)
+
+    snapshot = _snapshot
+    manifiesto = snapshot[1]
+    if manifiesto["cuantizado"] != CUANTIZAR_REFERENCIAS:
+        return None
+
+    try:
+        mtime_carpeta = os.stat(VOCES_AUTORIZADAS).st_mtime_ns
+    except OSError:
+        return None
+    ahora = time.monotonic()
+    sin_cambios = _revisado[:2] == (snapshot[0], mtime_carpeta)
+    if sin_cambios and ahora - _revisado[2] < SNAPSHOT_REVISAR_SEG:
+        return snapshot
+
+    if manifiesto.get("voces") != _huella_voces():
+        return None
+    _revisado = (snapshot[0], mtime_carpeta, ahora)
+    return snapshot
+
+
+def _mapear(manifiesto):
+    """Abre cada matriz del snapshot con np.memmap (solo lectura, sin copiar)."""
+    path = _ruta_snapshot(manifiesto["archivo"])
+    matrices = {}
+    for clave, m in manifiesto["matrices"].items():
+        dtype, forma = np.dtype(m["dtype"]), tuple(m["forma"])
+        if 0 in forma:
+            matrices[clave] = np.zeros(forma, dtype=dtype)
+        else:
+            matrices[clave] = np.memmap(path, dtype=dtype, mode="r", offset=m["offset"], shape=forma)
+    return matrices
+
+
+def publicar_snapshot():
+    """
+    Apila todas las voces del índice en un único archivo binario y publica
+    su manifiesto con os.replace: los lectores ven la generación anterior
+    completa o la nueva completa, nunca una a medias.
+    """
+    global _snapshot
+
+    with _lock:
+        huella = _huella_voces()
+        indice = cargar_indice()
+        nombres = list(indice)
+        apiladas = apilar_referencias(list(indice.values()), CUANTIZAR_REFERENCIAS)
+
+        anterior = None
+        if os.path.exists(VOCES_JSON):
+            try:
+                with open(VOCES_JSON, "r", encoding="utf-8") as f:
+                    anterior = json.load(f)
+            except (OSError, ValueError):
+                pass
+        generacion = (anterior or {}).get("generacion", 0) + 1
+
+        # Matrices una detrás de otra, alineadas a 64 bytes
+        os.makedirs(INDICE_VOCES, exist_ok=True)
+        archivo = f"snapshot_{generacion:06d}_{uuid.uuid4().hex[:8]}.bin"
+        destino = _ruta_snapshot(archivo)
+        matrices, offset = {}, 0
+        with open(destino + ".tmp", "wb") as f:
+            for clave, m in apiladas.items():
+                m = np.ascontiguousarray(m)
+                relleno = -offset % 64
+                f.write(b"\0" * relleno)
+                offset += relleno
+                f.write(m.tobytes())
+                matrices[clave] = {"offset": offset, "dtype": m.dtype.str, "forma": list(m.shape)}
+                offset += m.nbytes
+        os.replace(destino + ".tmp", destino)
+
+        manifiesto = {
+            "version": VERSION_INDICE,
+            "generacion": generacion,
+            "archivo": archivo,
+            "cuantizado": CUANTIZAR_REFERENCIAS,
+            "voces": huella,
+            "nombres": nombres,
+            "matrices": matrices,
+        }
+        tmp = f"{VOCES_JSON}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f)
+        mtime = os.stat(tmp).st_mtime_ns   # el rename lo conserva
+        os.replace(tmp, VOCES_JSON)
+        _snapshot = (mtime, manifiesto, _mapear(manifiesto))
+
+        _sincronizar_ann(indice)
+        _limpiar_snapshots(archivo, (anterior or {}).get("archivo"))
+
+        # Las características ya quedaron en el snapshot
+        _cache.clear()
+        return manifiesto
+
+
+def _limpiar_snapshots(*conservar):
+    """
+    Borra generaciones viejas. Se conservan la propia, la anterior (para los
+    workers que todavía la tengan mapeada), la que esté publicada ahora (otro
+    proceso pudo publicar en el medio) y las recién escritas, que otro
+    proceso puede estar por publicar. En Windows un archivo mapeado no se
+    puede borrar y queda para la próxima limpieza.
+    """
+    conservar = set(conservar)
+    try:
+        with open(VOCES_JSON, "r", encoding="utf-8") as f:
+            conservar.add(json.load(f).get("archivo"))
+    except (OSError, ValueError):
+        pass
+
+    limite = time.time() - SNAPSHOT_GRACIA_SEG
+    for e in os.scandir(INDICE_VOCES):
+        if e.name.startswith("snapshot_") and e.name.endswith(".bin") and e.name not in conservar:
+            try:
+                if e.stat().st_mtime < limite:
+                    os.remove(e.path)
+            except OSError:
+                pass
+
+
+# =======================================================
+# Índice aproximado (IVF) para la preselección
+# =======================================================
+def _obtener_ann():
+    """IndiceIVF compartido; se relee si otro proceso lo actualizó."""
+    global _ann
+    mtime = os.path.getmtime(INDICE_ANN) if os.path.exists(INDICE_ANN) else None
+    if _ann[1] is None or _ann[0] != mtime:
+        ann = IndiceIVF.cargar(INDICE_ANN) if mtime else IndiceIVF(dim=20, n_listas=ANN_LISTAS)
+        _ann = (mtime, ann)
+    return _ann[1]
+
+
+def _guardar_ann(ann):
+    global _ann
+    ann.guardar(INDICE_ANN)
+    _ann = (os.path.getmtime(INDICE_ANN), ann)
+
+
+def _sincronizar_ann(indice):
+    """
+    Da de alta (en un solo lote) las voces que faltan o se reindexaron y de
+    baja las que ya no existen. Guarda el archivo una sola vez.
+    """
+    ann = _obtener_ann()
+    cambios = False
+
+    for nombre in set(ann.claves) - set(indice):
+        cambios |= ann.eliminar(nombre)
+
+    altas = [n for n in indice if n not in ann or n in _ann_pendientes]
+    if altas:
+        ann.agregar_lote(altas, [indice[n]["mfcc"] for n in altas])
+        cambios = True
+    _ann_pendientes.clear()
+
+    if cambios:
+        _guardar_ann(ann)
+
+
+def candidatos_voz(mfcc, nombres, refs):
+    """
+    Filas de refs que pasan la etapa gruesa. Con pocas voces se comparan
+    todas (exacto); desde ANN_MIN_VOCES se usa el índice IVF.
+    """
+    if len(nombres) < ANN_MIN_VOCES:
+        return preseleccionar(mfcc, refs, PRESELECCION_K, PRESELECCION_MARGEN)
+
+    fila = {nombre: i for i, nombre in enumerate(nombres)}
+    encontrados = [
+        (nombre, sim) for nombre, sim in _obtener_ann().buscar(mfcc, PRESELECCION_K, ANN_NPROBE)
+        if nombre in fila
+    ]
+    if not encontrados:
+        return np.zeros(0, dtype=np.int64)
+
+    mejor = encontrados[0][1]
+    return np.array(
+        [fila[nombre] for nombre, sim in encontrados if sim >= mejor - PRESELECCION_MARGEN],
+        dtype=np.int64
+    )
+
+
+# =======================================================
+# Informe de cuantización
+# =======================================================
+def _bytes(apiladas):
+    return sum(m.nbytes for m in apiladas.values())
+
+
+def informe_cuantizacion():
+    """
+    Compara el score de cada voz registrada (usada como sonda) contra todas
+    las demás con características float recalculadas desde el .wav y con
+    la forma cuantizada que se usa al verificar. Las voces cuyo .wav no se
+    puede leer quedan fuera (en "omitidas").
+    """
+    indice = cargar_indice()
+    nombres, flotantes, omitidas = [], [], []
+    for nombre in indice:
+        y, sr = cargar_audio(os.path.join(VOCES_AUTORIZADAS, nombre))
+        if y is None:
+            omitidas.append(nombre)
+            continue
+        nombres.append(nombre)
+        flotantes.append(calcular_caracteristicas(y, sr))
+    if not nombres:
+        return {"voces": 0, "omitidas": omitidas}
+
+    ref_float = apilar_referencias(flotantes)
+    ref_cuant = apilar_referencias([indice[n] for n in nombres], cuantizar=True)
+
+    diferencias, coinciden = [], 0
+    for sonda in flotantes:
+        s_float, i_float = puntuar_lote(sonda["senal"], sonda["fft"], sonda["mfcc"], ref_float)
+        s_cuant, i_cuant = puntuar_lote(sonda["senal"], sonda["fft"], sonda["mfcc"], ref_cuant)
+        validos = np.isfinite(s_float) & np.isfinite(s_cuant)
+        diferencias.append(np.abs(s_float[validos] - s_cuant[validos]))
+        coinciden += int(i_float == i_cuant)
+
+    diferencias = np.concatenate(diferencias)
+    return {
+        "voces": len(nombres),
+        "omitidas": omitidas,
+        "error_max": float(diferencias.max(initial=0)),
+        "error_medio": float(diferencias.mean()) if len(diferencias) else 0.0,
+        "mejor_coincide": coinciden / len(nombres),
+        "bytes_por_voz_float": _bytes(ref_float) / len(nombres),
+        "bytes_por_voz_cuantizado": _bytes(ref_cuant) / len(nombres),
+    }
+
+
+if __name__ == "__main__":
+    # python -m services.indice_service : informe de cuantización
+    import json
+    print(json.dumps(informe_cuantizacion(), indent=4))
@@ -0,0 +1,205 @@
+# services/stream_service.py
+
+import os
+import time
+import uuid
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from config import (
+    VERIFICACIONES, GUARDAR_VERIFICACIONES,
+    STREAM_MARGEN, STREAM_MIN_SEG, STREAM_MIN_SEG_RECHAZO, STREAM_TTL, STREAM_MAX_SESIONES,
+    STREAM_MAX_SEG, STREAM_MAX_BYTES
+)
+
+from services.audio_service import guardar_wav
+from services.transcodificador import FlujoTranscodificador
+from services.indice_service import cargar_referencias, candidatos_voz
+from services.voz_service import UMBRAL, resultado_verificacion
+from utils.audio_features import AcumuladorEspectral, AcumuladorMFCC, puntuar_candidatos
+
+SR = 16000
+
+_sesiones = {}
+_lock = threading.Lock()
+
+
+class SesionStream:
+    """
+    Verificación en vivo: los fragmentos del navegador (webm) entran a un
+    ffmpeg abierto durante toda la sesión (acotada por STREAM_MAX_SESIONES,
+    STREAM_MAX_SEG y STREAM_MAX_BYTES) y cada uno se decodifica una sola
+    vez. Las muestras nuevas pasan a los acumuladores, que usan el mismo
+    encuadre que la verificación de un audio completo.
+    """
+
+    def __init__(self):
+        self.creada = self.usada = time.time()
+        self.resultado = None
+        self.candidatos = 0
+        self._webm = bytearray()
+        self._y = np.zeros(0, dtype=np.float32)
+        self._ffmpeg = FlujoTranscodificador(SR)
+        self.uso = threading.Lock()     # un fragmento a la vez por sesión
+
+        self._espectro = AcumuladorEspectral()
+        self._mfcc = AcumuladorMFCC(SR)
+
+    # ---------------------------------------------------
+    # Audio
+    # ---------------------------------------------------
+    def agregar(self, fragmento):
+        """False si el fragmento pasaría STREAM_MAX_BYTES (no se agrega)."""
+        if len(self._webm) + len(fragmento) > STREAM_MAX_BYTES:
+            return False
+        self._webm.extend(fragmento)
+        self._ffmpeg.escribir(fragmento)
+        self.usada = time.time()
+        return True
+
+    def decodificar(self, final=False):
+        """
+        Pasa a los acumuladores las muestras nuevas que entregó ffmpeg.
+        Con final=True cierra su entrada y toma el resto. False si falló.
+        """
+        nuevas = self._ffmpeg.cerrar() if final else self._ffmpeg.leer()
+        if nuevas is None:
+            return False
+        if len(nuevas):
+            self._y = np.concatenate((self._y, nuevas))
+            self._espectro.agregar(nuevas)
+            self._mfcc.agregar(nuevas)
+        return True
+
+    def cerrar(self):
+        """Termina el ffmpeg de la sesión (decidida, vencida o descartada)."""
+        self._ffmpeg.matar()
+
+    # ---------------------------------------------------
+    # Características y score
+    # ---------------------------------------------------
+    def puntuar(self):
+        """Score con lo ya acumulado. Devuelve (match, score, segundos)."""
+        y = self._y
+        nombres, refs = cargar_referencias()
+        fft, mfcc = self._espectro.valor(), self._mfcc.valor()
+        filas = candidatos_voz(mfcc, nombres, refs)
+        score, idx, self.candidatos = puntuar_candidatos(y, fft, mfcc, refs, filas)
+        if idx is None:
+            return None, -1, len(y) / SR
+        return nombres[idx], score, len(y) / SR
+
+    def archivar(self):
+        if not GUARDAR_VERIFICACIONES:
+            return
+        os.makedirs(VERIFICACIONES, exist_ok=True)
+        nombre = datetime.now().strftime("%Y%m%d_%H%M%S")
+        with open(os.path.join(VERIFICACIONES, nombre + ".webm"), "wb") as f:
+            f.write(self._webm)
+        guardar_wav(os.path.join(VERIFICACIONES, nombre + ".wav"), self._y, SR)
+
+
+# =======================================================
+# API del servicio
+# =======================================================
+def _limpiar_vencidas():
+    """
+    Descarta las sesiones sin uso hace más de STREAM_TTL. Se llama en cada
+    petición; sus ffmpeg se terminan fuera del lock.
+    """
+    ahora = time.time()
+    with _lock:
+        vencidas = {i: s for i, s in _sesiones.items() if ahora - s.usada > STREAM_TTL}
+        for id_sesion in vencidas:
+            del _sesiones[id_sesion]
+    for sesion in vencidas.values():
+        sesion.cerrar()
+
+
+def iniciar_stream():
+    """Crea una sesión y devuelve su id, o None si ya hay STREAM_MAX_SESIONES."""
+    _limpiar_vencidas()
+    with _lock:
+        if len(_sesiones) >= STREAM_MAX_SESIONES:
+            return None
+        id_sesion = uuid.uuid4().hex
+        _sesiones[id_sesion] = SesionStream()
+    return id_sesion
+
+
+def _obtener(id_sesion):
+    _limpiar_vencidas()
+    with _lock:
+        return _sesiones.get(id_sesion)
+
+
+def _descartar(id_sesion, sesion):
+    with _lock:
+        _sesiones.pop(id_sesion, None)
+    sesion.cerrar()
+
+
+def _decidir(id_sesion, sesion, match, score):
+    sesion.archivar()
+    sesion.resultado = dict(resultado_verificacion(match, score, sesion.candidatos), final=True)
+    _descartar(id_sesion, sesion)
+    return sesion.resultado
+
+
+def agregar_fragmento(id_sesion, fragmento):
+    """
+    Suma un fragmento y devuelve el estado actual. Si el score ya está
+    claramente por encima o por debajo de UMBRAL, o se llegó a
+    STREAM_MAX_SEG de audio, decide en el momento. Devuelve None si la
+    sesión no existe y {"error": ...} si pasa STREAM_MAX_BYTES.
+    """
+    sesion = _obtener(id_sesion)
+    if sesion is None:
+        return None
+
+    with sesion.uso:
+        if sesion.resultado is not None:
+            return sesion.resultado
+
+        if not sesion.agregar(fragmento):
+            _descartar(id_sesion, sesion)
+            return {"error": "Audio demasiado largo"}
+        sesion.decodificar()
+        match, score, segundos = sesion.puntuar()
+
+        if segundos >= STREAM_MAX_SEG:
+            return _decidir(id_sesion, sesion, match, score)
+        if segundos >= STREAM_MIN_SEG and score >= UMBRAL + STREAM_MARGEN:
+            return _decidir(id_sesion, sesion, match, score)
+        if segundos >= STREAM_MIN_SEG_RECHAZO and score <= UMBRAL - STREAM_MARGEN:
+            return _decidir(id_sesion, sesion, match, score)
+
+    return {
+        "estado": "pendiente",
+        "final": False,
+        "match": match,
+        "score": score,
+        "candidatos": sesion.candidatos,
+        "segundos": segundos
+    }
+
+
+def finalizar_stream(id_sesion):
+    """Fin de la grabación: decide con todo lo recibido usando UMBRAL."""
+    sesion = _obtener(id_sesion)
+    if sesion is None:
+        return None
+
+    with sesion.uso:
+        if sesion.resultado is not None:
+            return sesion.resultado
+
+        sesion.decodificar(final=True)
+        match, score, segundos = sesion.puntuar()
+        if segundos == 0:
+            _descartar(id_sesion, sesion)
+            return {"error": "No se pudo procesar el audio"}
+
+        return _decidir(id_sesion, sesion, match, score)
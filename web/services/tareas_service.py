@@ -0,0 +1,86 @@
+# services/tareas_service.py
+
+import time
+import uuid
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import TAREAS_WORKERS, TAREAS_TTL
+
+_executor = None
+_tareas = {}   # id -> dict(creada, estado, resultado)
+_lock = threading.Lock()
+
+
+def _obtener_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=TAREAS_WORKERS)
+    return _executor
+
+
+def _descartar_executor(executor):
+    """Un pool roto (un worker murió) no acepta más tareas: se arma otro."""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _limpiar_vencidas():
+    ahora = time.time()
+    for id_tarea, tarea in list(_tareas.items()):
+        if tarea["estado"] != "pendiente" and ahora - tarea["creada"] > TAREAS_TTL:
+            del _tareas[id_tarea]
+
+
+def encolar_tarea(funcion, *args, al_terminar=None):
+    """
+    Ejecuta funcion(*args) en el pool de procesos y devuelve un id.
+    al_terminar(resultado) corre en este proceso cuando la tarea termina
+    (para registrar en el historial, armar la respuesta, etc).
+    """
+    id_tarea = uuid.uuid4().hex
+
+    with _lock:
+        _limpiar_vencidas()
+        _tareas[id_tarea] = {"creada": time.time(), "estado": "pendiente", "resultado": None}
+        executor = _obtener_executor()
+        try:
+            futuro = executor.submit(funcion, *args)
+        except BrokenProcessPool:
+            _descartar_executor(executor)
+            executor = _obtener_executor()
+            futuro = executor.submit(funcion, *args)
+
+    def _listo(f):
+        try:
+            resultado = f.result()
+            if al_terminar is not None:
+                resultado = al_terminar(resultado)
+            estado = "listo"
+        except BrokenProcessPool as e:
+            with _lock:
+                _descartar_executor(executor)
+            resultado = {"error": str(e)}
+            estado = "error"
+        except Exception as e:
+            resultado = {"error": str(e)}
+            estado = "error"
+
+        with _lock:
+            if id_tarea in _tareas:
+                _tareas[id_tarea].update(estado=estado, resultado=resultado)
+
+    futuro.add_done_callback(_listo)
+    return id_tarea
+
+
+def estado_tarea(id_tarea):
+    """Devuelve {"estado": ..., "resultado": ...} o None si no existe."""
+    with _lock:
+        tarea = _tareas.get(id_tarea)
+        if tarea is None:
+            return None
+        return {"estado": tarea["estado"], "resultado": tarea["resultado"]}
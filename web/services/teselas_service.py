@@ -0,0 +1,140 @@
+# services/teselas_service.py
+#
+# Pirámide de teselas del espectrograma: el STFT en dB se guarda una vez
+# por audio en varios niveles de detalle (cada nivel junta 2 frames del
+# anterior) y se sirve de a teselas de TESELA_ANCHO frames, así al hacer
+# zoom o desplazarse solo se leen las teselas visibles.
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import numpy as np
+
+from config import TESELAS_DIR, TESELA_ANCHO, TESELA_FILAS, TESELAS_MAX_AUDIOS
+
+from services.analisis_service import analizar, HOP
+from services.datos_graficos_service import bandas_log, DB_MIN
+from utils.cache import hash_archivo
+
+
+def _carpeta(h):
+    return os.path.join(TESELAS_DIR, h)
+
+
+_hashes_lock = threading.Lock()
+_hashes = {}   # hash del audio -> Lock (una construcción a la vez por pirámide)
+
+
+def _lock_hash(h):
+    with _hashes_lock:
+        return _hashes.setdefault(h, threading.Lock())
+
+
+def _construir(path_audio, h):
+    """Calcula todos los niveles y los deja en TESELAS_DIR/<hash>/."""
+    a = analizar(path_audio)
+    S_dB, sr = a.S_dB, a.sr
+
+    # Bandas logarítmicas (máximo de cada banda) y uint8 de DB_MIN a 0 dB
+    bordes = bandas_log(S_dB.shape[0], sr / 2, TESELA_FILAS)
+    S = np.maximum.reduceat(S_dB, bordes, axis=0)
+    nivel = np.clip((S - DB_MIN) / -DB_MIN * 255, 0, 255).astype(np.uint8).T   # (frames, filas)
+
+    # Carpeta temporal propia: otro proceso puede estar armando la misma
+    destino = _carpeta(h)
+    tmp = tempfile.mkdtemp(prefix=h + ".", suffix=".tmp", dir=TESELAS_DIR)
+    try:
+        _escribir_niveles(tmp, a, bordes, nivel)
+        os.replace(tmp, destino)
+    except OSError:
+        # Si falló porque otro proceso la armó primero, se usa esa
+        if not os.path.exists(os.path.join(destino, "meta.json")):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    _podar()
+
+
+def _escribir_niveles(tmp, a, bordes, nivel):
+    """Guarda cada nivel (.npy) y meta.json en la carpeta tmp."""
+    S_dB, sr = a.S_dB, a.sr
+    frames = []
+    while True:
+        np.save(os.path.join(tmp, f"nivel_{len(frames)}.npy"), np.ascontiguousarray(nivel))
+        frames.append(len(nivel))
+        if len(nivel) <= TESELA_ANCHO:
+            break
+        # Siguiente nivel: máximo de cada par de frames
+        if len(nivel) % 2:
+            nivel = np.vstack((nivel, nivel[-1:]))
+        nivel = np.maximum(nivel[0::2], nivel[1::2])
+
+    meta = {
+        "sr": int(sr),
+        "duracion": a.duracion,
+        "hop": HOP,
+        "ancho": TESELA_ANCHO,
+        "filas": int(len(bordes)),
+        "f": (bordes * (sr / 2) / (S_dB.shape[0] - 1)).round(1).tolist(),
+        "db_min": DB_MIN,
+        "niveles": [
+            {"frames": n, "teselas": -(-n // TESELA_ANCHO), "segundos_por_frame": HOP * 2 ** i / sr}
+            for i, n in enumerate(frames)
+        ],
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _podar():
+    """Deja como mucho TESELAS_MAX_AUDIOS pirámides (borra las menos usadas)."""
+    if not os.path.isdir(TESELAS_DIR):
+        return
+    piramides = sorted(
+        (os.path.getmtime(os.path.join(e.path, "meta.json")), e.path)
+        for e in os.scandir(TESELAS_DIR)
+        if e.is_dir() and not e.name.endswith(".tmp") and os.path.exists(os.path.join(e.path, "meta.json"))
+    )
+    for _, path in piramides[:max(len(piramides) - TESELAS_MAX_AUDIOS, 0)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+# =======================================================
+# API
+# =======================================================
+def info_teselas(path_audio):
+    """Metadatos de la pirámide (la arma si no existe). Incluye el hash."""
+    h = hash_archivo(path_audio)
+    path_meta = os.path.join(_carpeta(h), "meta.json")
+    if not os.path.exists(path_meta):
+        # Si otra petición ya la está armando, se espera y se reusa
+        with _lock_hash(h):
+            if not os.path.exists(path_meta):
+                os.makedirs(TESELAS_DIR, exist_ok=True)
+                _construir(path_audio, h)
+
+    os.utime(path_meta)   # marca de uso para la poda
+    with open(path_meta, "r", encoding="utf-8") as f:
+        return dict(json.load(f), version=h[:16])
+
+
+def tesela(path_audio, nivel, x):
+    """
+    Tesela x del nivel pedido: uint8 (frames, filas), fila 0 = frecuencia
+    más baja. Se lee del .npy mapeado en memoria, sin cargar el nivel entero.
+    Devuelve None si no existe.
+    """
+    h = hash_archivo(path_audio)
+    path = os.path.join(_carpeta(h), f"nivel_{nivel}.npy")
+    if not os.path.exists(path):
+        info_teselas(path_audio)
+        if not os.path.exists(path):
+            return None
+
+    datos = np.load(path, mmap_mode="r")
+    inicio = x * TESELA_ANCHO
+    if x < 0 or inicio >= len(datos):
+        return None
+    return np.array(datos[inicio:inicio + TESELA_ANCHO])
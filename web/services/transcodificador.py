@@ -0,0 +1,272 @@
+# services/transcodificador.py
+
+import os
+import queue
+import atexit
+import subprocess
+import threading
+import time
+import numpy as np
+
+from config import FFMPEG_WORKERS, FFMPEG_TIMEOUT, FFMPEG_COLA
+
+
+class _Trabajo:
+    def __init__(self, datos, sr):
+        self.datos = datos
+        self.sr = sr
+        self.resultado = None
+        self.proceso = None
+        self.cancelado = False
+        self.listo = threading.Event()
+
+
+class PoolTranscodificador:
+    """
+    Conjunto acotado de workers que decodifican audio con ffmpeg.
+    Las peticiones esperan en una cola en vez de lanzar un ffmpeg cada una,
+    y cada trabajo tiene un tiempo máximo tras el cual se mata el proceso.
+    """
+
+    def __init__(self, workers=FFMPEG_WORKERS, timeout=FFMPEG_TIMEOUT, cola_max=FFMPEG_COLA):
+        self.timeout = timeout
+        self._cola = queue.Queue(maxsize=cola_max)
+        self._activos = set()
+        self._lock = threading.Lock()
+        self._hilos = []
+
+        for i in range(workers):
+            h = threading.Thread(target=self._trabajar, name=f"ffmpeg-{i}", daemon=True)
+            h.start()
+            self._hilos.append(h)
+
+    # ---------------------------------------------------
+    # API
+    # ---------------------------------------------------
+    def decodificar(self, datos, sr=16000, timeout=None):
+        """
+        Devuelve (y, sr) con PCM mono float32, o (None, None) si el audio
+        no se pudo decodificar, la cola está llena o se agotó el tiempo.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        trabajo = _Trabajo(datos, sr)
+
+        try:
+            self._cola.put_nowait(trabajo)   # cola llena: se rechaza en el momento
+        except queue.Full:
+            return None, None
+
+        if not trabajo.listo.wait(timeout):
+            self._cancelar(trabajo)
+            return None, None
+
+        if trabajo.resultado is None:
+            return None, None
+        return trabajo.resultado, sr
+
+    def matar_todo(self):
+        """Mata todas las conversiones en curso."""
+        with self._lock:
+            activos = list(self._activos)
+        for trabajo in activos:
+            self._cancelar(trabajo)
+
+    # ---------------------------------------------------
+    # Internos
+    # ---------------------------------------------------
+    def _cancelar(self, trabajo):
+        with self._lock:
+            trabajo.cancelado = True
+            proceso = trabajo.proceso
+        if proceso is not None and proceso.poll() is None:
+            proceso.kill()
+
+    def _trabajar(self):
+        while True:
+            trabajo = self._cola.get()
+            try:
+                self._ejecutar(trabajo)
+            except Exception as e:
+                # El hilo sigue vivo: un error de un trabajo no achica el pool
+                print(f"❌ ffmpeg: {e}")
+            finally:
+                trabajo.listo.set()
+                self._cola.task_done()
+
+    def _ejecutar(self, trabajo):
+        cmd = [
+            "ffmpeg",
+            "-i", "pipe:0",
+            "-f", "f32le",
+            "-ar", str(trabajo.sr),
+            "-ac", "1",
+            "pipe:1"
+        ]
+
+        with self._lock:
+            if trabajo.cancelado:
+                return
+            try:
+                trabajo.proceso = subprocess.Popen(
+                    cmd,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL
+                )
+            except OSError:
+                return   # sin ffmpeg, sin descriptores o sin procesos: el trabajo falla
+            self._activos.add(trabajo)
+
+        try:
+            salida, _ = trabajo.proceso.communicate(trabajo.datos, timeout=self.timeout)
+        except (subprocess.TimeoutExpired, OSError):
+            trabajo.proceso.kill()
+            trabajo.proceso.communicate()
+            return
+        finally:
+            with self._lock:
+                self._activos.discard(trabajo)
+
+        if trabajo.proceso.returncode == 0 and salida and not trabajo.cancelado:
+            trabajo.resultado = np.frombuffer(salida, dtype=np.float32)
+
+
+class FlujoTranscodificador:
+    """
+    Un ffmpeg abierto durante toda una verificación en vivo: los fragmentos
+    se le escriben a medida que llegan y solo se leen las muestras nuevas,
+    sin volver a decodificar lo anterior. Un hilo vacía su salida para que
+    la escritura nunca se bloquee.
+    """
+
+    QUIETO = 0.05   # segundos sin salida nueva que se toman como "ffmpeg al día"
+
+    def __init__(self, sr=16000, timeout=FFMPEG_TIMEOUT):
+        self.timeout = timeout
+        self._pcm = bytearray()
+        self._cond = threading.Condition()
+        self._fin = False
+
+        try:
+            self._proceso = subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-probesize", "32", "-analyzeduration", "0",
+                    "-i", "pipe:0",
+                    "-f", "f32le",
+                    "-ar", str(sr),
+                    "-ac", "1",
+                    "pipe:1"
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+        except OSError:
+            self._proceso = None
+            self._fin = True
+            return
+
+        self._lector = threading.Thread(target=self._leer, name="ffmpeg-flujo", daemon=True)
+        self._lector.start()
+
+    def escribir(self, datos):
+        """Manda un fragmento a ffmpeg. False si el proceso ya terminó."""
+        if self._proceso is None:
+            return False
+        try:
+            self._proceso.stdin.write(datos)
+            self._proceso.stdin.flush()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def leer(self):
+        """
+        Muestras nuevas desde la última lectura. Espera (hasta el timeout)
+        a que ffmpeg deje de producir, así incluyen el último fragmento.
+        """
+        limite = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._fin and time.monotonic() < limite:
+                antes = len(self._pcm)
+                self._cond.wait(self.QUIETO)
+                if len(self._pcm) == antes:
+                    break
+            return self._tomar()
+
+    def cerrar(self):
+        """Cierra la entrada y devuelve las muestras restantes (None si ffmpeg falló)."""
+        if self._proceso is None:
+            return None
+        try:
+            self._proceso.stdin.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            self._proceso.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            self.matar()
+        self._lector.join(timeout=self.timeout)
+
+        with self._cond:
+            if self._proceso.returncode != 0:
+                return None
+            return self._tomar()
+
+    def matar(self):
+        if self._proceso is not None and self._proceso.poll() is None:
+            self._proceso.kill()
+
+    def _leer(self):
+        while True:
+            bloque = self._proceso.stdout.read1(65536)
+            with self._cond:
+                if not bloque:
+                    self._fin = True
+                    self._cond.notify_all()
+                    return
+                self._pcm.extend(bloque)
+                self._cond.notify_all()
+
+    def _tomar(self):
+        n = len(self._pcm) // 4 * 4
+        y = np.frombuffer(bytes(self._pcm[:n]), dtype=np.float32)
+        del self._pcm[:n]
+        return y
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _reiniciar_en_hijo():
+    """
+    Un proceso hijo creado con fork hereda el pool pero no sus hilos:
+    se descarta para que el hijo arme el suyo al primer uso.
+    """
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+def _al_salir():
+    """Al cerrar el servidor no quedan conversiones de ffmpeg huérfanas."""
+    if _pool is not None:
+        _pool.matar_todo()
+
+
+atexit.register(_al_salir)
+
+
+def obtener_pool():
+    """Pool compartido por todo el servicio de audio."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolTranscodificador()
+        return _pool
@@ -1,49 +1,51 @@
-import os, uuid, json
+import os
 from flask import jsonify
-import numpy as np
-import librosa
 from datetime import datetime
 
 # Rutas
-from config import VOCES_AUTORIZADAS, VERIFICACIONES, VOCES_JSON
+from config import VOCES_AUTORIZADAS, VERIFICACIONES, GUARDAR_VERIFICACIONES
 
 # Servicios
-from services.audio_service import convertir_webm_a_wav, cargar_audio, normalizar
+from services.audio_service import decodificar_audio, guardar_wav
+from services.indice_service import actualizar_indice, cargar_referencias, candidatos_voz
+from services.analisis_service import analizar_senal, recordar
 
 # Features mejorados
-from utils.audio_features import espectro_fft, mfcc_features, similitud
+from utils.audio_features import espectro_fft, puntuar_candidatos
 
-# Historial
-from utils.historial import registrar_evento_json
+# Cache por contenido
+from utils.cache import cache_audio, hash_bytes
 
+# Tareas en segundo plano
+from services.tareas_service import encolar_tarea
 
-# =======================================================
-# Guardar JSON (no lo usas mucho, pero lo dejo corregido)
-# =======================================================
-def _guardar_json(data):
-    with open(VOCES_JSON, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
+# Historial
+from utils.historial import registrar_evento_json
 
 
 # =======================================================
 # Registrar voz nueva
 # =======================================================
 def procesar_registro_voz(archivo, es_agregar=False):
-    tmp = f"tmp_reg_{uuid.uuid4().hex[:8]}.webm"
-    archivo.save(tmp)
+    y, sr = decodificar_audio(archivo.read())
+    if y is None:
+        return "❌ No se pudo procesar el audio."
 
     nombre_wav = (
         "voz_registrada.wav"
         if not es_agregar
-        else archivo.filename.replace(".webm", ".wav")
+        else os.path.splitext(archivo.filename)[0] + ".wav"
     )
 
     path_final = os.path.join(VOCES_AUTORIZADAS, nombre_wav)
+    guardar_wav(path_final, y, sr)
 
-    convertir_webm_a_wav(tmp, path_final)
+    # Una sola STFT: da los MFCC del índice y queda como análisis del .wav
+    a = analizar_senal(y, sr)
+    recordar(path_final, a)
 
-    if os.path.exists(tmp):
-        os.remove(tmp)
+    # Precalcular características para la verificación
+    actualizar_indice(nombre_wav, y, sr, mfcc=a.mfcc)
 
     return f"Voz '{nombre_wav}' agregada correctamente."
 
@@ -58,105 +60,120 @@ def listar_voces():
 # =======================================================
 # Verificación de voz
 # =======================================================
-def procesar_verificacion_voz(archivo):
-
-    os.makedirs(VERIFICACIONES, exist_ok=True)
+UMBRAL = 0.42   # valor recomendado después de FFT + MFCC
 
-    # Guardar archivo recibido
-    nombre = datetime.now().strftime("%Y%m%d_%H%M%S")
-    webm = os.path.join(VERIFICACIONES, nombre + ".webm")
-    wav = os.path.join(VERIFICACIONES, nombre + ".wav")
 
-    archivo.save(webm)
-    convertir_webm_a_wav(webm, wav)
+def verificar_audio(datos):
+    """
+    Decodifica, archiva (si corresponde) y compara contra las voces
+    registradas. Devuelve (mejor_archivo, mejor_score, candidatos), donde
+    candidatos es cuántas voces pasaron la preselección, o None si el audio
+    no se pudo procesar. No toca Flask ni el historial, así puede correr
+    en un proceso aparte.
+    """
 
     # ============================
-    # Cargar señal temporal
+    # Decodificar señal temporal (en memoria)
     # ============================
-    y_temp, sr_temp = cargar_audio(wav)
-    if y_temp is None:
-        return jsonify({"error": "No se pudo procesar el audio"}), 500
+    h = hash_bytes(datos)
+
+    def _decodificar():
+        y, sr = decodificar_audio(datos)
+        return None if y is None else (y, sr)
+
+    pcm = cache_audio.calcular(f"pcm-16000-{h}", _decodificar)
+    if pcm is None:
+        return None
+    y_temp, sr_temp = pcm
+
+    # Archivar el intento solo si está configurado
+    path_wav = None
+    if GUARDAR_VERIFICACIONES:
+        os.makedirs(VERIFICACIONES, exist_ok=True)
+        nombre = datetime.now().strftime("%Y%m%d_%H%M%S")
+        with open(os.path.join(VERIFICACIONES, nombre + ".webm"), "wb") as f:
+            f.write(datos)
+        path_wav = os.path.join(VERIFICACIONES, nombre + ".wav")
+        guardar_wav(path_wav, y_temp, sr_temp)
 
     # ------------------------------
     # Extraer características robustas
     # ------------------------------
-    fft_temp = espectro_fft(y_temp)
-    mfcc_temp = mfcc_features(y_temp, sr_temp)  # ← ya promediado en utils
+    def _caracteristicas():
+        # Los MFCC salen del análisis compartido, que queda también
+        # como análisis del .wav archivado
+        a = analizar_senal(y_temp, sr_temp)
+        if path_wav:
+            recordar(path_wav, a)
+        return espectro_fft(y_temp), a.mfcc
 
-    mejor_score = -1
-    mejor_archivo = None
+    fft_temp, mfcc_temp = cache_audio.calcular(f"feats-{h}", _caracteristicas)
 
     # ======================================================
-    # Comparar contra cada voz registrada
+    # Preselección por MFCC (exacta o IVF) y score completo de los candidatos
+    # (0.45 temporal / 0.35 FFT / 0.20 MFCC)
     # ======================================================
-    for f in listar_voces():
-
-        ref_path = os.path.join(VOCES_AUTORIZADAS, f)
-        y_ref, sr_ref = cargar_audio(ref_path)
-        if y_ref is None:
-            continue
-
-        # ===== Recorte para señal temporal =====
-        L = min(len(y_temp), len(y_ref))
-        if L < 3000:  # mínimo 0.18s a 16kHz
-            continue
-
-        y1 = normalizar(y_temp[:L])
-        y2 = normalizar(y_ref[:L])
-
-        # --------- 1) Correlación temporal ---------
-        corr_temp = similitud(y1, y2)
-
-        # --------- 2) FFT (frecuencia) --------------
-        fft_ref = espectro_fft(y2)
-        L_fft = min(len(fft_temp), len(fft_ref))
-        corr_fft = similitud(fft_temp[:L_fft], fft_ref[:L_fft])
-
-        # --------- 3) MFCC (timbre) ----------------
-        mfcc_ref = mfcc_features(y2, sr_ref)
-        L_m = min(len(mfcc_temp), len(mfcc_ref))
-        corr_mfcc = similitud(mfcc_temp[:L_m], mfcc_ref[:L_m])
-
-        # ====== Score combinado ======
-        score = (
-            0.45 * corr_temp +
-            0.35 * corr_fft +
-            0.20 * corr_mfcc
-        )
+    nombres, refs = cargar_referencias()
+    filas = candidatos_voz(mfcc_temp, nombres, refs)
+    score, idx, candidatos = puntuar_candidatos(y_temp, fft_temp, mfcc_temp, refs, filas)
+
+    if idx is None:
+        return None, -1, candidatos
+    return nombres[idx], score, candidatos
 
-        if score > mejor_score:
-            mejor_score = score
-            mejor_archivo = f
 
-    # ==========================
-    # DECISIÓN FINAL
-    # ==========================
-    UMBRAL = 0.42   # valor recomendado después de FFT + MFCC
+def resultado_verificacion(mejor_archivo, mejor_score, candidatos=None):
+    """Decisión final: registra el evento y arma la respuesta."""
 
     if mejor_score >= UMBRAL:
         registrar_evento_json(
             f"Acceso OK (match={mejor_archivo}, score={mejor_score:.3f})",
-            tipo="ACCESO"
+            tipo="ACCESO", match=mejor_archivo, score=mejor_score
         )
-        return jsonify({
+        return {
             "estado": "ok",
             "redirect": "/acceso",
             "match": mejor_archivo,
             "score": mejor_score,
+            "candidatos": candidatos,
             "acceso": True,
             "mensaje": f"acceso consedido, voz parecida a {mejor_archivo}"
-        })
+        }
 
     # Falló
     registrar_evento_json(
         f"Acceso fallido (score={mejor_score:.3f})",
-        tipo="ERROR"
+        tipo="ERROR", score=mejor_score
     )
 
-    return jsonify({
+    return {
         "estado": "denegado",
         "match": mejor_archivo,
         "score": mejor_score,
+        "candidatos": candidatos,
         "acceso": False,
         "mensaje":"acceso denegado, tu voz no esta registrada"
-    })
+    }
+
+
+def procesar_verificacion_voz(archivo):
+    """Verificación síncrona (dentro del hilo de la petición)."""
+    r = verificar_audio(archivo.read())
+    if r is None:
+        return jsonify({"error": "No se pudo procesar el audio"}), 500
+
+    return jsonify(resultado_verificacion(*r))
+
+
+# =======================================================
+# Verificación asíncrona (pool de procesos)
+# =======================================================
+def _terminar_verificacion(r):
+    if r is None:
+        return {"error": "No se pudo procesar el audio"}
+    return resultado_verificacion(*r)
+
+
+def encolar_verificacion_voz(archivo):
+    """Encola la verificación y devuelve el id de la tarea."""
+    return encolar_tarea(verificar_audio, archivo.read(), al_terminar=_terminar_verificacion)
@@ -12,9 +12,10 @@ async function grabarYEnviar(urlDestino) {
         const formData = new FormData();
         formData.append("audio", blob, "voz.webm");
 
-        const res = await fetch(urlDestino, { method: "POST", body: formData });
-        const data = await res.json();
-        alert(data.mensaje);
+        const data = urlDestino === "/verificar_voz"
+            ? await verificarAsync(formData)
+            : await (await fetch(urlDestino, { method: "POST", body: formData })).json();
+        alert(data.mensaje || data.error);
 
         if (data.acceso) {
             // Redirigir solo si la voz coincide
@@ -27,6 +28,25 @@ async function grabarYEnviar(urlDestino) {
     setTimeout(() => mediaRecorder.stop(), 3000);
 }
 
+// Verificación asíncrona: se encola y se consulta el estado.
+// Si el servidor no la soporta se usa la verificación síncrona.
+async function verificarAsync(formData) {
+    try {
+        const res = await fetch("/verificar_voz_async", { method: "POST", body: formData });
+        if (res.status !== 202) throw new Error("sin modo asíncrono");
+        const { id } = await res.json();
+
+        while (true) {
+            await new Promise(r => setTimeout(r, 300));
+            const estado = await fetch(`/verificar_voz/estado/${id}`);
+            if (estado.status !== 202) return await estado.json();
+        }
+    } catch (e) {
+        const res = await fetch("/verificar_voz", { method: "POST", body: formData });
+        return await res.json();
+    }
+}
+
 // Para registrar voz base:
 function registrarVoz() {
     grabarYEnviar("/guardar_voz");
@@ -37,3 +57,50 @@ function verificarVoz() {
     grabarYEnviar("/verificar_voz");
 }
 
+
+// Verificación en vivo: se envían fragmentos mientras se graba y el
+// servidor puede decidir antes de que termine la grabación.
+async function verificarVozStream() {
+    let id;
+    try {
+        const res = await fetch("/verificar_stream", { method: "POST" });
+        if (!res.ok) throw new Error("sin modo en vivo");
+        id = (await res.json()).id;
+    } catch (e) {
+        return verificarVoz();
+    }
+
+    const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+    const recorder = new MediaRecorder(stream);
+    let envios = Promise.resolve();
+    let decidido = false;
+
+    const terminar = data => {
+        if (decidido) return;
+        decidido = true;
+        if (recorder.state !== "inactive") recorder.stop();
+        stream.getTracks().forEach(t => t.stop());
+        alert(data.mensaje || data.error);
+        if (data.acceso) window.location.href = "/acceso";
+    };
+
+    recorder.ondataavailable = e => {
+        // Los fragmentos se envían en orden, uno detrás del otro
+        envios = envios.then(async () => {
+            if (decidido) return;
+            const res = await fetch(`/verificar_stream/${id}`, { method: "POST", body: e.data });
+            const data = await res.json();
+            if (data.final || data.error) terminar(data);
+        });
+    };
+    recorder.onstop = () => {
+        envios = envios.then(async () => {
+            if (decidido) return;
+            const res = await fetch(`/verificar_stream/${id}/fin`, { method: "POST" });
+            terminar(await res.json());
+        });
+    };
+
+    recorder.start(250);
+    setTimeout(() => { if (recorder.state !== "inactive") recorder.stop(); }, 3000);
+}
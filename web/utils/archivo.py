@@ -2,27 +2,11 @@
 
 import os
 import json
-import subprocess
 
 def asegurar_carpeta(carpeta):
     os.makedirs(carpeta, exist_ok=True)
 
 
-def convertir_webm_a_wav(entrada, salida, sr_target=16000):
-    """
-    Conversión usando ffmpeg.
-    """
-    comando = [
-        "ffmpeg",
-        "-y",
-        "-i", entrada,
-        "-ar", str(sr_target),
-        "-ac", "1",
-        salida
-    ]
-    subprocess.run(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-
 def leer_json(path):
     if not os.path.exists(path):
         return []
@@ -1,21 +1,287 @@
 import numpy as np
-import librosa
 
 def normalizar(v):
     return v / (np.linalg.norm(v) + 1e-9)
 
-def espectro_fft(y):
-    """Magnitud FFT normalizada."""
-    Y = np.fft.rfft(y)
-    mag = np.abs(Y)
+def espectro_fft(y, n_fft=1024, hop=512):
+    """
+    Magnitud FFT promediada por tramos (Welch) y normalizada.
+    Siempre devuelve n_fft//2 + 1 valores, sin importar el largo del audio,
+    y cada FFT es de tamaño fijo (costo proporcional a la duración).
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) < n_fft:
+        y = np.pad(y, (0, n_fft - len(y)))
+
+    tramos = np.lib.stride_tricks.sliding_window_view(y, n_fft)[::hop]
+    potencia = np.abs(np.fft.rfft(tramos * np.hanning(n_fft), axis=1)) ** 2
+    mag = np.sqrt(potencia.mean(axis=0))
     return normalizar(mag)
 
 def mfcc_features(y, sr, n_mfcc=20):
     """MFCC normalizados."""
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc)
-    mfcc_mean = np.mean(mfcc, axis=1)
-    return normalizar(mfcc_mean)
+    return mfcc_desde_stft(stft_magnitud(y), sr, n_mfcc)
+
+def stft_magnitud(y, n_fft=2048, hop=512):
+    """|STFT| con los parámetros por defecto de librosa (ventana hann, centrada)."""
+    import librosa  # importación diferida (librosa tarda en cargar)
+    return np.abs(librosa.stft(np.asarray(y, dtype=np.float32), n_fft=n_fft, hop_length=hop))
+
+def mfcc_desde_stft(S, sr, n_mfcc=20):
+    """
+    MFCC promediados y normalizados a partir de una |STFT| ya calculada.
+    Da lo mismo que librosa.feature.mfcc(y=...) con la misma STFT.
+    """
+    import librosa  # importación diferida (librosa tarda en cargar)
+    mel = librosa.feature.melspectrogram(S=S ** 2, sr=sr)
+    mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=n_mfcc)
+    return normalizar(np.mean(mfcc, axis=1))
+
+def espectrograma_db(y, S=None):
+    """STFT en dB (ref = máximo), la misma que dibuja el espectrograma."""
+    import librosa  # importación diferida (librosa tarda en cargar)
+    if S is None:
+        S = stft_magnitud(y)
+    return librosa.amplitude_to_db(S, ref=np.max)
 
 def similitud(v1, v2):
     """Correlación entre dos vectores."""
     return float(np.corrcoef(v1, v2)[0, 1])
+
+
+# =======================================================
+# Puntaje por lotes (una sonda contra N referencias)
+# =======================================================
+PESOS = {"senal": 0.45, "fft": 0.35, "mfcc": 0.20}
+MIN_MUESTRAS = 3000  # mínimo 0.18s a 16kHz
+
+
+def apilar(vectores, dtype=np.float32):
+    """Apila vectores de distinto largo en una matriz rellena con ceros."""
+    largos = np.array([len(v) for v in vectores], dtype=np.int64)
+    M = np.zeros((len(vectores), int(largos.max(initial=0))), dtype=dtype)
+    for i, v in enumerate(vectores):
+        M[i, :len(v)] = v
+    return M, largos
+
+
+def cuantizar_int8(M):
+    """
+    Cuantiza cada dimensión (columna) a int8 con su propia escala.
+    M ≈ Q * escalas. Devuelve (Q, escalas).
+    """
+    escalas = np.abs(M).max(axis=0, initial=0) / 127
+    escalas[escalas == 0] = 1
+    Q = np.round(M / escalas).astype(np.int8)
+    return Q, escalas.astype(np.float32)
+
+
+def apilar_referencias(refs, cuantizar=False):
+    """
+    refs: lista de dicts con "senal", "fft" y "mfcc".
+    Devuelve las matrices que usa puntuar_lote. Con cuantizar=True la señal
+    queda en int16 y FFT/MFCC en int8 por dimensión (con "escala_fft" y
+    "escala_mfcc"); puntuar_lote trabaja directo sobre esa forma.
+    """
+    senal, largo_senal = apilar([r["senal"] for r in refs], np.int16 if cuantizar else np.float32)
+    fft, largo_fft = apilar([r["fft"] for r in refs])
+    mfcc, largo_mfcc = apilar([r["mfcc"] for r in refs])
+
+    apiladas = {
+        "senal": senal, "largo_senal": largo_senal,
+        "fft": fft, "largo_fft": largo_fft,
+        "mfcc": mfcc, "largo_mfcc": largo_mfcc,
+    }
+    if cuantizar:
+        apiladas["fft"], apiladas["escala_fft"] = cuantizar_int8(fft)
+        apiladas["mfcc"], apiladas["escala_mfcc"] = cuantizar_int8(mfcc)
+    return apiladas
+
+
+def correlacion_lote(v, M, largos, escalas=None):
+    """
+    Correlación de Pearson entre v[:L] y M[i, :L] para cada fila,
+    con L = min(len(v), largos[i]). M debe venir rellena con ceros,
+    así el producto matricial ya respeta el recorte de cada fila.
+    Si M está cuantizada por dimensión, `escalas` son sus escalas
+    (la fila real es M[i] * escalas) y no hace falta decuantizar.
+    """
+    v = np.asarray(v, dtype=np.float64)
+    n = min(len(v), M.shape[1])
+    v, M = v[:n], M[:, :n]
+    L = np.minimum(largos, n)
+
+    # Sumas de la sonda recortada a cada largo
+    cv = np.concatenate(([0.0], np.cumsum(v)))
+    cv2 = np.concatenate(([0.0], np.cumsum(v * v)))
+    sx, sxx = cv[L], cv2[L]
+
+    # Sumas de cada referencia (los ceros de relleno no aportan). Una matriz
+    # entera (int8/int16) se pasa a float32 una sola vez: operar directo con
+    # vectores float64 la copiaría a float64 en cada producto
+    if M.dtype.kind in "iu":
+        M = M.astype(np.float32)
+    if escalas is None:
+        sy = M.sum(axis=1, dtype=np.float64)
+        syy = np.einsum("ij,ij->i", M, M, dtype=np.float64)
+        sxy = (M @ v.astype(M.dtype)).astype(np.float64)
+    else:
+        e = np.asarray(escalas[:n], dtype=M.dtype)
+        sy = (M @ e).astype(np.float64)
+        syy = np.einsum("ij,ij,j->i", M, M, e * e).astype(np.float64)
+        sxy = (M @ (v.astype(M.dtype) * e)).astype(np.float64)
+
+    num = L * sxy - sx * sy
+    den = np.sqrt((L * sxx - sx ** 2) * (L * syy - sy ** 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return num / den
+
+
+def puntuar_lote(senal, fft, mfcc, refs):
+    """
+    Score combinado de una sonda contra todas las referencias apiladas.
+    Devuelve (scores, indice del mejor o None).
+    """
+    corr_temp = correlacion_lote(senal, refs["senal"], refs["largo_senal"])
+    corr_fft = correlacion_lote(fft, refs["fft"], refs["largo_fft"], refs.get("escala_fft"))
+    corr_mfcc = correlacion_lote(mfcc, refs["mfcc"], refs["largo_mfcc"], refs.get("escala_mfcc"))
+
+    scores = (
+        PESOS["senal"] * corr_temp +
+        PESOS["fft"] * corr_fft +
+        PESOS["mfcc"] * corr_mfcc
+    )
+
+    # Referencias demasiado cortas o sin varianza quedan descartadas
+    cortas = np.minimum(refs["largo_senal"], len(senal)) < MIN_MUESTRAS
+    scores[cortas | np.isnan(scores)] = -np.inf
+
+    if len(scores) == 0 or np.isneginf(scores).all():
+        return scores, None
+    return scores, int(np.argmax(scores))
+
+
+# =======================================================
+# Preselección en dos etapas (gruesa → fina)
+# =======================================================
+def subconjunto(refs, filas):
+    """Filas elegidas de las matrices apiladas (las escalas son por dimensión)."""
+    return {
+        clave: m if clave.startswith("escala_") else m[filas]
+        for clave, m in refs.items()
+    }
+
+
+def preseleccionar(mfcc, refs, k, margen):
+    """
+    Etapa gruesa: correlación del vector MFCC contra todas las referencias
+    (una matriz de N x 20). Devuelve los índices de hasta k candidatos,
+    descartando los que quedan a más de `margen` del mejor.
+    """
+    gruesos = correlacion_lote(mfcc, refs["mfcc"], refs["largo_mfcc"], refs.get("escala_mfcc"))
+    gruesos = np.nan_to_num(gruesos, nan=-np.inf)
+    if len(gruesos) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    k = min(k, len(gruesos))
+    top = np.argpartition(-gruesos, k - 1)[:k]
+    top = top[np.argsort(-gruesos[top])]
+    return top[gruesos[top] >= gruesos[top[0]] - margen]
+
+
+def puntuar_candidatos(senal, fft, mfcc, refs, candidatos):
+    """
+    Score combinado solo sobre las filas `candidatos` de refs.
+    Devuelve (score del mejor, índice del mejor o None, cantidad de candidatos).
+    """
+    candidatos = np.asarray(candidatos, dtype=np.int64)
+    scores, idx = puntuar_lote(senal, fft, mfcc, subconjunto(refs, candidatos))
+    if idx is None:
+        return -1, None, len(candidatos)
+    return float(scores[idx]), int(candidatos[idx]), len(candidatos)
+
+
+def puntuar_preseleccion(senal, fft, mfcc, refs, k, margen):
+    """Etapa gruesa exacta (preseleccionar) + score completo de los candidatos."""
+    candidatos = preseleccionar(mfcc, refs, k, margen)
+    return puntuar_candidatos(senal, fft, mfcc, refs, candidatos)
+
+
+# =======================================================
+# Acumuladores incrementales (verificación en vivo)
+# =======================================================
+class AcumuladorEspectral:
+    """
+    Versión incremental de espectro_fft: suma la potencia de cada tramo
+    completo a medida que llegan muestras. valor() da el mismo descriptor
+    que espectro_fft sobre todo lo recibido.
+    """
+
+    def __init__(self, n_fft=1024, hop=512):
+        self.n_fft, self.hop = n_fft, hop
+        self._ventana = np.hanning(n_fft)
+        self._resto = np.zeros(0)
+        self._suma = np.zeros(n_fft // 2 + 1)
+        self._tramos = 0
+
+    def agregar(self, y):
+        datos = np.concatenate((self._resto, np.asarray(y, dtype=np.float64)))
+        if len(datos) < self.n_fft:
+            self._resto = datos
+            return
+        tramos = np.lib.stride_tricks.sliding_window_view(datos, self.n_fft)[::self.hop]
+        self._suma += (np.abs(np.fft.rfft(tramos * self._ventana, axis=1)) ** 2).sum(axis=0)
+        self._tramos += len(tramos)
+        self._resto = datos[len(tramos) * self.hop:]
+
+    def valor(self):
+        if self._tramos == 0:
+            return espectro_fft(self._resto, self.n_fft, self.hop)
+        return normalizar(np.sqrt(self._suma / self._tramos))
+
+
+class AcumuladorMFCC:
+    """
+    Versión incremental de mfcc_features: la misma STFT centrada (n_fft//2
+    ceros de relleno a cada lado) pero cada tramo se transforma una sola
+    vez. Se guarda el espectro mel de cada tramo y el paso a dB se hace en
+    valor() sobre todos juntos (top_db es relativo al máximo de todo el
+    audio), así el resultado coincide con el de la señal completa.
+    """
+
+    def __init__(self, sr, n_mfcc=20, n_fft=2048, hop=512):
+        self.sr, self.n_mfcc, self.n_fft, self.hop = sr, n_mfcc, n_fft, hop
+        self._resto = np.zeros(n_fft // 2, dtype=np.float32)   # relleno inicial
+        self._mel = []        # bloques (n_mels, tramos)
+        self._tramos = 0
+        self._muestras = 0
+
+    def _mel_tramos(self, datos):
+        import librosa  # importación diferida (librosa tarda en cargar)
+        S = np.abs(librosa.stft(datos, n_fft=self.n_fft, hop_length=self.hop, center=False))
+        return librosa.feature.melspectrogram(S=S ** 2, sr=self.sr)
+
+    def agregar(self, y):
+        self._muestras += len(y)
+        datos = np.concatenate((self._resto, np.asarray(y, dtype=np.float32)))
+        if len(datos) < self.n_fft:
+            self._resto = datos
+            return
+        tramos = 1 + (len(datos) - self.n_fft) // self.hop
+        self._mel.append(self._mel_tramos(datos[:(tramos - 1) * self.hop + self.n_fft]))
+        self._tramos += tramos
+        self._resto = datos[tramos * self.hop:]
+
+    def valor(self):
+        import librosa  # importación diferida (librosa tarda en cargar)
+
+        if self._muestras == 0:
+            return np.zeros(self.n_mfcc)
+
+        # Tramos del final (llegan al relleno derecho): se calculan sin guardarlos
+        faltan = 1 + self._muestras // self.hop - self._tramos
+        cola = np.concatenate((self._resto, np.zeros(self.n_fft // 2, dtype=np.float32)))
+        mel = np.hstack(self._mel + [self._mel_tramos(cola)[:, :faltan]])
+
+        mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=self.n_mfcc)
+        return normalizar(np.mean(mfcc, axis=1))
@@ -0,0 +1,216 @@
+# utils/cache.py
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config import CACHE_MEMORIA_MB, CACHE_DISCO_MB, CACHE_DIR
+
+
+# =======================================================
+# Hash de contenido
+# =======================================================
+_hashes = {}   # path -> (mtime_ns, tamaño, hash)
+_hashes_lock = threading.Lock()
+
+
+def hash_bytes(datos):
+    return hashlib.sha1(datos).hexdigest()
+
+
+def hash_archivo(path):
+    """
+    Hash del contenido de un archivo. Se recalcula solo si cambió su
+    fecha o tamaño, así un archivo modificado genera claves nuevas.
+    """
+    st = os.stat(path)
+    with _hashes_lock:
+        memo = _hashes.get(path)
+    if memo and memo[0] == st.st_mtime_ns and memo[1] == st.st_size:
+        return memo[2]
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    digest = h.hexdigest()
+
+    with _hashes_lock:
+        _hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+# =======================================================
+# Cache LRU (memoria + disco opcional)
+# =======================================================
+def _tamano(valor):
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, tuple):
+        return sum(_tamano(v) for v in valor)
+    return 64
+
+
+class CacheContenido:
+    """
+    Cache de PCM y características indexado por hash de contenido.
+    Los valores son arrays de numpy o tuplas de arrays/escalares.
+    """
+
+    def __init__(self, max_bytes_memoria, carpeta_disco=None, max_bytes_disco=0):
+        self.max_bytes_memoria = max_bytes_memoria
+        self.carpeta_disco = carpeta_disco if max_bytes_disco > 0 else None
+        self.max_bytes_disco = max_bytes_disco
+
+        self._memoria = OrderedDict()   # clave -> (valor, bytes)
+        self._bytes_memoria = 0
+        self._bytes_disco = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits_memoria": 0, "hits_disco": 0, "misses": 0}
+
+        if self.carpeta_disco:
+            os.makedirs(self.carpeta_disco, exist_ok=True)
+            self._bytes_disco = sum(
+                e.stat().st_size for e in os.scandir(self.carpeta_disco) if e.name.endswith(".npz")
+            )
+
+    # ---------------------------------------------------
+    # API
+    # ---------------------------------------------------
+    def obtener(self, clave):
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                self.stats["hits_memoria"] += 1
+                return self._memoria[clave][0]
+
+        valor = self._leer_disco(clave)
+        with self._lock:
+            if valor is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits_disco"] += 1
+        self._guardar_memoria(clave, valor)
+        return valor
+
+    def guardar(self, clave, valor):
+        self._guardar_memoria(clave, valor)
+        self._escribir_disco(clave, valor)
+
+    def calcular(self, clave, funcion):
+        """Devuelve el valor cacheado o lo calcula con funcion() y lo guarda."""
+        valor = self.obtener(clave)
+        if valor is None:
+            valor = funcion()
+            if valor is not None:
+                self.guardar(clave, valor)
+        return valor
+
+    def invalidar(self, fragmento):
+        """Borra todas las entradas cuya clave contiene `fragmento` (ej. un hash)."""
+        with self._lock:
+            for clave in [c for c in self._memoria if fragmento in c]:
+                self._bytes_memoria -= self._memoria.pop(clave)[1]
+
+        if self.carpeta_disco:
+            for e in list(os.scandir(self.carpeta_disco)):
+                if fragmento in e.name:
+                    self._borrar_disco(e.path)
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                entradas_memoria=len(self._memoria),
+                bytes_memoria=self._bytes_memoria,
+                max_bytes_memoria=self.max_bytes_memoria,
+                bytes_disco=self._bytes_disco,
+                max_bytes_disco=self.max_bytes_disco,
+            )
+
+    # ---------------------------------------------------
+    # Memoria
+    # ---------------------------------------------------
+    def _guardar_memoria(self, clave, valor):
+        tam = _tamano(valor)
+        if tam > self.max_bytes_memoria:
+            return
+
+        with self._lock:
+            if clave in self._memoria:
+                self._bytes_memoria -= self._memoria.pop(clave)[1]
+            self._memoria[clave] = (valor, tam)
+            self._bytes_memoria += tam
+
+            while self._bytes_memoria > self.max_bytes_memoria:
+                _, (_, t) = self._memoria.popitem(last=False)
+                self._bytes_memoria -= t
+
+    # ---------------------------------------------------
+    # Disco
+    # ---------------------------------------------------
+    def _ruta(self, clave):
+        return os.path.join(self.carpeta_disco, clave + ".npz")
+
+    def _leer_disco(self, clave):
+        if not self.carpeta_disco:
+            return None
+        path = self._ruta(clave)
+        try:
+            with np.load(path) as data:
+                partes = [data[f"a{i}"] for i in range(len(data.files))]
+            os.utime(path)   # marca de uso para el LRU de disco
+        except (OSError, ValueError, KeyError):
+            return None
+
+        partes = [p.item() if p.ndim == 0 else p for p in partes]
+        return partes[0] if len(partes) == 1 else tuple(partes)
+
+    def _escribir_disco(self, clave, valor):
+        if not self.carpeta_disco:
+            return
+        partes = valor if isinstance(valor, tuple) else (valor,)
+        path = self._ruta(clave)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **{f"a{i}": np.asarray(p) for i, p in enumerate(partes)})
+        tam = os.path.getsize(tmp)
+        if os.path.exists(path):
+            self._borrar_disco(path)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._bytes_disco += tam
+            excedido = self._bytes_disco > self.max_bytes_disco
+        if excedido:
+            self._podar_disco()
+
+    def _borrar_disco(self, path):
+        try:
+            tam = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._bytes_disco -= tam
+
+    def _podar_disco(self):
+        """Borra los archivos usados hace más tiempo hasta entrar en el presupuesto."""
+        entradas = sorted(
+            (e for e in os.scandir(self.carpeta_disco) if e.name.endswith(".npz")),
+            key=lambda e: e.stat().st_mtime
+        )
+        for e in entradas:
+            if self._bytes_disco <= self.max_bytes_disco:
+                break
+            self._borrar_disco(e.path)
+
+
+# Cache compartido por los servicios de audio
+cache_audio = CacheContenido(
+    CACHE_MEMORIA_MB * 1024 * 1024,
+    carpeta_disco=CACHE_DIR,
+    max_bytes_disco=CACHE_DISCO_MB * 1024 * 1024,
+)
@@ -0,0 +1,40 @@
+# utils/decimado.py
+
+import numpy as np
+
+
+def envolvente(y, x=None, puntos=2000, rango=None):
+    """
+    Reduce una curva a `puntos` columnas guardando el mínimo y el máximo de
+    cada una (en el orden en que aparecen). Dibujada como línea se ve igual
+    que la original, pero con a lo sumo 2*puntos valores en vez de millones.
+
+    - x: abscisas (crecientes); por defecto el índice de muestra.
+    - puntos: resolución de salida, del orden del ancho del gráfico en píxeles.
+    - rango: (x_min, x_max) visible; se recorta antes de reducir, así un
+      xlim chico no pierde detalle.
+
+    Devuelve (x, y).
+    """
+    y = np.asarray(y)
+    x = np.arange(len(y)) if x is None else np.asarray(x)
+
+    if rango is not None:
+        a, b = np.searchsorted(x, rango)
+        a, b = max(a - 1, 0), min(b + 1, len(x))   # un punto de cada lado llega al borde
+        x, y = x[a:b], y[a:b]
+
+    n = len(y)
+    if n <= 2 * puntos:
+        return x, y
+
+    # Columnas de igual largo; la última se completa repitiendo la última muestra
+    largo = -(-n // puntos)
+    columnas = -(-n // largo)
+    bloques = np.pad(y, (0, columnas * largo - n), mode="edge").reshape(columnas, largo)
+    inicio = np.arange(columnas) * largo
+    i_min = np.minimum(bloques.argmin(axis=1) + inicio, n - 1)
+    i_max = np.minimum(bloques.argmax(axis=1) + inicio, n - 1)
+
+    idx = np.column_stack((np.minimum(i_min, i_max), np.maximum(i_min, i_max))).ravel()
+    return x[idx], y[idx]
@@ -1,28 +1,640 @@
-import json, os
-from datetime import datetime
-from config import HISTORIAL_JSON
+import json, os, gzip, time, shutil, struct, atexit, threading
+from datetime import datetime, timedelta
+from config import (
+    HISTORIAL_JSON, HISTORIAL_LOG, HISTORIAL_IDX, HISTORIAL_POR_PAGINA,
+    HISTORIAL_LOTE, HISTORIAL_FLUSH_SEG, HISTORIAL_COLA_MAX, HISTORIAL_DESBORDE,
+    HISTORIAL_BACKEND, HISTORIAL_STATS,
+    HISTORIAL_ARCHIVO_DIR, HISTORIAL_ROTAR_MB, HISTORIAL_ROTAR_DIAS, HISTORIAL_RETENCION_DIAS
+)
+from utils import historial_stats
 
-def registrar_evento_json(evento, tipo="INFO"):
+if HISTORIAL_BACKEND == "sqlite":
+    from utils import historial_sqlite
+else:
+    historial_sqlite = None
+
+# Bloqueo de archivo entre procesos (fcntl en Linux/Mac, msvcrt en Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+# =======================================================
+# Bloqueo
+# =======================================================
+def _bloquear(f, compartido=False):
+    """Con compartido=True varios lectores a la vez (en Windows es exclusivo igual)."""
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if compartido else fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _desbloquear(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _linea(entrada):
+    return (json.dumps(entrada, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+# =======================================================
+# Migración desde historial.json (una sola vez)
+# =======================================================
+_migrado = False
+
+
+def _migrar(f):
+    """
+    Pasa las entradas del historial.json viejo al log por líneas y lo
+    renombra. Se llama con el log ya bloqueado.
+    """
+    global _migrado
+    _migrado = True
+    if not os.path.exists(HISTORIAL_JSON):
+        return
+
+    with open(HISTORIAL_JSON, "r", encoding="utf-8") as viejo:
+        try: historial = json.load(viejo)
+        except ValueError: historial = []
+
+    f.write(b"".join(_linea(e) for e in historial))
+    f.flush()
+    os.replace(HISTORIAL_JSON, HISTORIAL_JSON + ".migrado")
+
+
+# =======================================================
+# Índice de offsets (historial.idx)
+# =======================================================
+# Un registro de largo fijo por línea del log: offset, largo, fecha como
+# entero AAAAMMDDhhmmss y código de tipo. Con él se filtra y pagina sin
+# parsear el log: solo se leen las líneas de la página pedida.
+TIPOS = ["INFO", "ACCESO", "ERROR", "ACCION"]
+_REGISTRO = struct.Struct("<QIqB")
+
+
+def _codigo_tipo(tipo):
+    return TIPOS.index(tipo) if tipo in TIPOS else 255
+
+
+def _fecha_entera(fecha):
+    try:
+        return int(datetime.strptime(fecha, "%Y-%m-%d %H:%M:%S").strftime("%Y%m%d%H%M%S"))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _dia(texto):
+    """"AAAA-MM-DD" -> AAAAMMDD, o None si no es una fecha válida."""
+    try:
+        return int(datetime.strptime(texto, "%Y-%m-%d").strftime("%Y%m%d"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _fin_indexado():
+    """Hasta qué byte del log cubre el índice."""
+    if not os.path.exists(HISTORIAL_IDX):
+        return 0
+    tam = os.path.getsize(HISTORIAL_IDX)
+    tam -= tam % _REGISTRO.size   # registro a medias tras un corte
+    if tam == 0:
+        return 0
+    with open(HISTORIAL_IDX, "rb") as f:
+        f.seek(tam - _REGISTRO.size)
+        offset, largo, _, _ = _REGISTRO.unpack(f.read(_REGISTRO.size))
+    return offset + largo
+
+
+def _actualizar_indice():
+    """
+    Indexa las líneas del log que todavía no están en el índice (en general
+    solo la última). Si el log es más corto que lo indexado se rehace.
+    Se llama con el log bloqueado.
+    """
+    tam_log = os.path.getsize(HISTORIAL_LOG) if os.path.exists(HISTORIAL_LOG) else 0
+    desde = _fin_indexado()
+    if desde > tam_log:
+        desde = 0
+    if desde == tam_log and os.path.exists(HISTORIAL_IDX):
+        return
+
+    nuevos = []
+    with open(HISTORIAL_LOG, "rb") as f:
+        f.seek(desde)
+        offset = desde
+        for linea in f:
+            if not linea.endswith(b"\n"):
+                break   # línea todavía incompleta
+            try:
+                entrada = json.loads(linea)
+                nuevos.append(_REGISTRO.pack(
+                    offset, len(linea), _fecha_entera(entrada.get("fecha")), _codigo_tipo(entrada.get("tipo"))
+                ))
+            except ValueError:
+                pass
+            offset += len(linea)
+
+    if desde:
+        with open(HISTORIAL_IDX, "r+b") as f:
+            f.truncate(os.path.getsize(HISTORIAL_IDX) // _REGISTRO.size * _REGISTRO.size)
+            f.seek(0, os.SEEK_END)
+            f.write(b"".join(nuevos))
+    else:
+        with open(HISTORIAL_IDX, "wb") as f:
+            f.write(b"".join(nuevos))
+
+
+# =======================================================
+# Escritura y lectura
+# =======================================================
+def _escribir(entradas):
+    """
+    Agrega las entradas al final del log con una sola escritura bloqueada.
+    Solo falla (con excepción) si las entradas no llegaron al log: lo que
+    viene después (índice, contadores, rotación) se recupera solo en la
+    próxima escritura, así que un error ahí se informa y no se propaga,
+    para que el lote no se vuelva a agregar.
+    """
+    if historial_sqlite:
+        if entradas:
+            historial_sqlite.escribir(entradas)
+            try:
+                _actualizar_estadisticas(entradas)
+                _podar_sqlite()
+            except Exception as e:
+                print(f"❌ historial: {e}")
+        return
+
+    with open(HISTORIAL_LOG, "ab") as f:
+        _bloquear(f)
+        try:
+            if not _migrado:
+                _migrar(f)
+            inicio = os.fstat(f.fileno()).st_size
+            f.write(b"".join(_linea(e) for e in entradas))
+            f.flush()
+            try:
+                _mantener(f, entradas, inicio)
+            except Exception as e:
+                print(f"❌ historial: {e}")
+        finally:
+            _desbloquear(f)
+
+
+def _mantener(f, entradas, inicio):
+    """Índice, contadores y rotación tras agregar al log (ya bloqueado)."""
+    _actualizar_indice()
+    if entradas:
+        _actualizar_estadisticas(entradas, inicio, os.fstat(f.fileno()).st_size)
+    if _toca_rotar(f):
+        _rotar(f)
+
+
+def _leer_crudo():
+    if historial_sqlite:
+        return historial_sqlite.leer()
+    segmentos = _segmentos()
+    if not os.path.exists(HISTORIAL_LOG) and not segmentos:
+        if os.path.exists(HISTORIAL_JSON):
+            with open(HISTORIAL_JSON, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return []
+
+    # Los segmentos rotados se leen aunque falte el log vivo
+    if os.path.exists(HISTORIAL_LOG):
+        segmentos.append(HISTORIAL_LOG)
+    registros = []
+    for path in segmentos:
+        with (gzip.open if path.endswith(".gz") else open)(path, "rt", encoding="utf-8") as f:
+            for linea in f:
+                try: registros.append(json.loads(linea))
+                except ValueError: pass   # línea cortada por un corte de luz, etc.
+    return registros
+
+
+# =======================================================
+# Estadísticas incrementales (historial_stats.json)
+# =======================================================
+_resumen = (None, None)   # (mtime, estadísticas) del último archivo leído
+
+
+def _leer_estadisticas():
+    try:
+        with open(HISTORIAL_STATS, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stats if historial_stats.valida(stats) else None
+
+
+def _guardar_estadisticas(stats):
+    with open(HISTORIAL_STATS + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(stats, f, separators=(",", ":"))
+    os.replace(HISTORIAL_STATS + ".tmp", HISTORIAL_STATS)
+
+
+def _actualizar_estadisticas(entradas, inicio=None, fin=None):
+    """
+    Suma el lote a los contadores. Si faltan, están dañados o no cubren el
+    log hasta `inicio` (ej. tras un corte), se rehacen desde el log.
+    """
+    with open(HISTORIAL_STATS + ".lock", "ab") as candado:
+        _bloquear(candado)
+        try:
+            stats = _leer_estadisticas()
+            if stats is None or (inicio is not None and stats["hasta"] != inicio):
+                stats = historial_stats.sumar(historial_stats.vacias(), _leer_crudo())
+            else:
+                historial_stats.sumar(stats, entradas)
+            stats["hasta"] = fin or 0
+            _guardar_estadisticas(stats)
+        finally:
+            _desbloquear(candado)
+
+
+def _rehacer_estadisticas():
+    with open(HISTORIAL_STATS + ".lock", "ab") as candado:
+        _bloquear(candado)
+        try:
+            stats = historial_stats.sumar(historial_stats.vacias(), _leer_crudo())
+            if not historial_sqlite and os.path.exists(HISTORIAL_LOG):
+                stats["hasta"] = os.path.getsize(HISTORIAL_LOG)
+            _guardar_estadisticas(stats)
+        finally:
+            _desbloquear(candado)
+    return stats
+
+
+def reconstruir_estadisticas():
+    """Rehace los contadores desde el log completo (segmentos incluidos)."""
+    vaciar_pendientes()
+    return _rehacer_estadisticas()
+
+
+def resumen_historial():
+    """
+    Contadores para dashboards: solo lee historial_stats.json (y solo si
+    cambió), sin tocar el log.
+    """
+    global _resumen
+    try:
+        mtime = os.stat(HISTORIAL_STATS).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    if mtime is None:
+        stats = reconstruir_estadisticas()
+        mtime = os.stat(HISTORIAL_STATS).st_mtime_ns
+    elif mtime != _resumen[0]:
+        stats = _leer_estadisticas() or reconstruir_estadisticas()
+    else:
+        return _resumen[1]
+
+    v = stats["verificaciones"]
+    resumen = {k: val for k, val in stats.items() if k not in ("version", "hasta")}
+    resumen["tasa_ok"] = v["ok"] / (v["ok"] + v["fallidos"]) if v["ok"] + v["fallidos"] else None
+    _resumen = (mtime, resumen)
+    return resumen
+
+
+# =======================================================
+# Rotación y retención (segmentos .jsonl.gz)
+# =======================================================
+# Cada segmento lleva al lado su índice (.idx) con los offsets del
+# contenido descomprimido, así se puede paginar también el archivo viejo.
+_podado_sqlite = 0.0
+
+
+def _segmentos():
+    """Segmentos archivados, del más viejo al más nuevo."""
+    if not os.path.isdir(HISTORIAL_ARCHIVO_DIR):
+        return []
+    return sorted(
+        e.path for e in os.scandir(HISTORIAL_ARCHIVO_DIR) if e.name.endswith(".jsonl.gz")
+    )
+
+
+def _idx_segmento(path):
+    return path[:-len(".jsonl.gz")] + ".idx"
+
+
+def _fechas_indice(path_idx):
+    """(primera, última) fecha entera del índice, o (0, 0) si está vacío."""
+    tam = os.path.getsize(path_idx) if os.path.exists(path_idx) else 0
+    tam -= tam % _REGISTRO.size
+    if tam == 0:
+        return 0, 0
+    with open(path_idx, "rb") as f:
+        primera = _REGISTRO.unpack(f.read(_REGISTRO.size))[2]
+        f.seek(tam - _REGISTRO.size)
+        ultima = _REGISTRO.unpack(f.read(_REGISTRO.size))[2]
+    return primera, ultima
+
+
+def _limite(dias):
+    return int((datetime.now() - timedelta(days=dias)).strftime("%Y%m%d%H%M%S"))
+
+
+def _toca_rotar(f):
+    tam = os.fstat(f.fileno()).st_size
+    if tam == 0:
+        return False
+    if tam >= HISTORIAL_ROTAR_MB * 1024 * 1024:
+        return True
+    primera = _fechas_indice(HISTORIAL_IDX)[0]
+    return 0 < primera < _limite(HISTORIAL_ROTAR_DIAS)
+
+
+def _rotar(f):
+    """
+    Comprime el log vivo (con su índice) en un segmento nuevo y lo deja
+    vacío. Se llama con el log bloqueado.
+    """
+    os.makedirs(HISTORIAL_ARCHIVO_DIR, exist_ok=True)
+    primera, ultima = _fechas_indice(HISTORIAL_IDX)
+    base = os.path.join(HISTORIAL_ARCHIVO_DIR, f"historial-{primera:014d}-{ultima:014d}")
+    n = 0
+    while os.path.exists(f"{base}-{n}.jsonl.gz"):
+        n += 1
+    destino = f"{base}-{n}.jsonl.gz"
+
+    with open(HISTORIAL_LOG, "rb") as origen, gzip.open(destino + ".tmp", "wb") as gz:
+        shutil.copyfileobj(origen, gz)
+    shutil.copyfile(HISTORIAL_IDX, _idx_segmento(destino))
+    os.replace(destino + ".tmp", destino)
+
+    f.truncate(0)
+    open(HISTORIAL_IDX, "wb").close()
+
+    # Los contadores siguen valiendo; solo cambia lo que cubren del log vivo
+    with open(HISTORIAL_STATS + ".lock", "ab") as candado:
+        _bloquear(candado)
+        try:
+            stats = _leer_estadisticas()
+            if stats is not None:
+                stats["hasta"] = 0
+                _guardar_estadisticas(stats)
+        finally:
+            _desbloquear(candado)
+
+    _aplicar_retencion()
+
+
+def _aplicar_retencion():
+    if not HISTORIAL_RETENCION_DIAS:
+        return
+    limite = _limite(HISTORIAL_RETENCION_DIAS)
+    borrados = False
+    for path in _segmentos():
+        if _fechas_indice(_idx_segmento(path))[1] < limite:
+            for p in (path, _idx_segmento(path)):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            borrados = True
+    if borrados:
+        _idx_segmentos.clear()
+        _rehacer_estadisticas()
+
+
+def _podar_sqlite():
+    """Retención para el backend SQLite (como mucho una vez por hora)."""
+    global _podado_sqlite
+    if not HISTORIAL_RETENCION_DIAS or time.time() - _podado_sqlite < 3600:
+        return
+    _podado_sqlite = time.time()
+    antes_de = (datetime.now() - timedelta(days=HISTORIAL_RETENCION_DIAS)).strftime("%Y-%m-%d %H:%M:%S")
+    if historial_sqlite.podar(antes_de):
+        _rehacer_estadisticas()
+
+
+# =======================================================
+# Escritor en segundo plano
+# =======================================================
+# Las peticiones solo agregan el evento a _pendientes; un hilo lo escribe
+# por lotes (al juntar HISTORIAL_LOTE o cada HISTORIAL_FLUSH_SEG).
+_pendientes = []
+_cond = threading.Condition()
+_escritura = threading.Lock()   # mantiene el orden entre el hilo y vaciar_pendientes
+_hilo_pid = None
+descartados = 0
+
+
+def _tomar_pendientes():
+    with _cond:
+        lote = _pendientes[:]
+        _pendientes.clear()
+    return lote
+
+
+def _devolver_pendientes(lote):
+    """Vuelve a poner un lote que no se pudo escribir delante de lo nuevo."""
+    with _cond:
+        _pendientes[:0] = lote
+
+
+def _escribir_lote(lote):
+    """
+    Escribe un lote (con _escritura tomado). Si no llegó al log vuelve a
+    quedar pendiente y la excepción sigue.
+    """
+    try:
+        _escribir(lote)
+    except Exception:
+        _devolver_pendientes(lote)
+        raise
+
+
+def vaciar_pendientes():
+    """Escribe ya todo lo pendiente (antes de leer y al cerrar)."""
+    with _escritura:
+        lote = _tomar_pendientes()
+        if lote:
+            _escribir_lote(lote)
+
+
+def _trabajar():
+    while True:
+        with _cond:
+            _cond.wait_for(lambda: len(_pendientes) >= HISTORIAL_LOTE, timeout=HISTORIAL_FLUSH_SEG)
+        try:
+            vaciar_pendientes()
+        except Exception as e:
+            # El lote sigue pendiente; el hilo no se cae y reintenta más tarde
+            print(f"❌ historial: {e}")
+            time.sleep(HISTORIAL_FLUSH_SEG)
+
+
+def _iniciar_escritor():
+    """Arranca el hilo (también en un proceso hijo creado con fork)."""
+    global _hilo_pid
+    if _hilo_pid == os.getpid():
+        return
+    with _cond:
+        if _hilo_pid == os.getpid():
+            return
+        _hilo_pid = os.getpid()
+    threading.Thread(target=_trabajar, name="historial", daemon=True).start()
+
+
+atexit.register(vaciar_pendientes)
+
+
+# =======================================================
+# Escritura y lectura
+# =======================================================
+def registrar_evento_json(evento, tipo="INFO", match=None, score=None):
+    """
+    Encola un evento para el log. La petición no toca el disco salvo que
+    la cola esté llena y HISTORIAL_DESBORDE sea "escribir".
+    match/score (verificaciones de voz) se guardan como campos aparte.
+    """
+    global descartados
     entrada = {
         "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "tipo": tipo,
         "evento": evento
     }
+    if match is not None:
+        entrada["match"] = match
+    if score is not None:
+        entrada["score"] = round(float(score), 4)
+    _iniciar_escritor()
 
-    if not os.path.exists(HISTORIAL_JSON):
-        historial = []
-    else:
-        with open(HISTORIAL_JSON, "r", encoding="utf-8") as f:
-            try: historial = json.load(f)
-            except: historial = []
+    with _cond:
+        if len(_pendientes) < HISTORIAL_COLA_MAX:
+            _pendientes.append(entrada)
+            if len(_pendientes) >= HISTORIAL_LOTE:
+                _cond.notify()
+            return
+        if HISTORIAL_DESBORDE == "descartar":
+            descartados += 1
+            return
 
-    historial.append(entrada)
+    # Cola llena: la petición escribe lo pendiente y su propio evento
+    with _escritura:
+        _escribir_lote(_tomar_pendientes() + [entrada])
 
-    with open(HISTORIAL_JSON, "w", encoding="utf-8") as f:
-        json.dump(historial, f, indent=4)
 
-def leer_historial_json():
-    if not os.path.exists(HISTORIAL_JSON):
-        return []
-    with open(HISTORIAL_JSON, "r", encoding="utf-8") as f:
-        return json.load(f)
+def borrar_historial():
+    """Vacía el log (con el mismo bloqueo que las escrituras)."""
+    if historial_sqlite:
+        with _escritura:
+            _tomar_pendientes()
+            historial_sqlite.borrar()
+            _guardar_estadisticas(historial_stats.vacias())
+        return
+
+    with _escritura, open(HISTORIAL_LOG, "ab") as f:
+        _tomar_pendientes()
+        _bloquear(f)
+        try:
+            if not _migrado:
+                _migrar(f)
+            f.truncate(0)
+            open(HISTORIAL_IDX, "wb").close()
+            for path in _segmentos():
+                for borrar in (path, _idx_segmento(path)):
+                    try:
+                        os.remove(borrar)
+                    except FileNotFoundError:
+                        pass
+            _idx_segmentos.clear()
+            _guardar_estadisticas(historial_stats.vacias())
+        finally:
+            _desbloquear(f)
+
+
+def consultar_historial(pagina=1, por_pagina=HISTORIAL_POR_PAGINA, tipo=None, desde=None, hasta=None):
+    """
+    Página de eventos, del más nuevo al más viejo, filtrada por tipo y por
+    rango de fechas ("AAAA-MM-DD"). Devuelve (registros, total filtrado).
+    """
+    with _escritura:
+        _escribir_lote(_tomar_pendientes())   # también pone al día el índice
+
+    if historial_sqlite:
+        return historial_sqlite.consultar(
+            pagina, por_pagina, tipo, desde if _dia(desde) else None, hasta if _dia(hasta) else None
+        )
+
+    # Con el log bloqueado (compartido): una rotación no puede vaciar el log
+    # ni su índice entre que se resuelven los offsets y se leen las líneas
+    with open(HISTORIAL_LOG, "ab") as candado:
+        _bloquear(candado, compartido=True)
+        try:
+            return _consultar_log(pagina, por_pagina, tipo, desde, hasta)
+        finally:
+            _desbloquear(candado)
+
+
+def _consultar_log(pagina, por_pagina, tipo, desde, hasta):
+    import numpy as np
+
+    # Del más nuevo al más viejo: log vivo y después los segmentos
+    fuentes = [(HISTORIAL_LOG, HISTORIAL_IDX)] + [(p, _idx_segmento(p)) for p in reversed(_segmentos())]
+
+    total, registros = 0, []
+    inicio = (max(pagina, 1) - 1) * por_pagina
+    for path, path_idx in fuentes:
+        idx = _leer_idx(path_idx)
+
+        filtro = np.ones(len(idx), dtype=bool)
+        if tipo:
+            filtro &= idx["tipo"] == _codigo_tipo(tipo)
+        if _dia(desde):
+            filtro &= idx["fecha"] >= _dia(desde) * 1000000
+        if _dia(hasta):
+            filtro &= idx["fecha"] <= _dia(hasta) * 1000000 + 235959
+        filas = np.flatnonzero(filtro)[::-1]
+
+        # Solo se abre la fuente si tiene filas de la página pedida
+        desde_aqui = max(inicio - total, 0)
+        faltan = por_pagina - len(registros)
+        if faltan > 0 and desde_aqui < len(filas):
+            elegidas = filas[desde_aqui:desde_aqui + faltan]
+            with (gzip.open if path.endswith(".gz") else open)(path, "rb") as f:
+                # gzip solo avanza bien hacia adelante: leer en orden de offset
+                lineas = {}
+                for fila in sorted(elegidas):
+                    f.seek(int(idx["offset"][fila]))
+                    lineas[fila] = json.loads(f.read(int(idx["largo"][fila])))
+            registros += [lineas[fila] for fila in elegidas]
+        total += len(filas)
+
+    return registros, total
+
+
+_idx_segmentos = {}   # path -> índice de un segmento (no cambian una vez escritos)
+
+
+def _leer_idx(path_idx):
+    import numpy as np
+
+    dtype = np.dtype([("offset", "<u8"), ("largo", "<u4"), ("fecha", "<i8"), ("tipo", "u1")])
+    if path_idx in _idx_segmentos:
+        return _idx_segmentos[path_idx]
+    if not os.path.exists(path_idx):
+        return np.zeros(0, dtype)
+
+    idx = np.fromfile(path_idx, dtype=dtype)
+    if path_idx != HISTORIAL_IDX:
+        _idx_segmentos[path_idx] = idx
+    return idx
+
+
+def estadisticas_historial():
+    """Estadísticas agregadas (solo con HISTORIAL_BACKEND = "sqlite")."""
+    if not historial_sqlite:
+        return None
+    vaciar_pendientes()
+    return historial_sqlite.estadisticas()
@@ -0,0 +1,217 @@
+# utils/historial_sqlite.py
+#
+# Backend SQLite del historial (HISTORIAL_BACKEND = "sqlite"). Guarda cada
+# evento con columnas propias para match y score, así las estadísticas
+# salen de consultas SQL con índices en vez de parsear texto.
+
+import os, re, gzip, json, sqlite3, threading
+from config import HISTORIAL_DB, HISTORIAL_LOG, HISTORIAL_JSON
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS eventos (
+    id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha  TEXT NOT NULL,     -- "AAAA-MM-DD hh:mm:ss"
+    tipo   TEXT NOT NULL,
+    evento TEXT NOT NULL,
+    match  TEXT,
+    score  REAL
+);
+CREATE INDEX IF NOT EXISTS eventos_fecha ON eventos (fecha);
+CREATE INDEX IF NOT EXISTS eventos_tipo_fecha ON eventos (tipo, fecha);
+CREATE INDEX IF NOT EXISTS eventos_match ON eventos (match) WHERE match IS NOT NULL;
+"""
+
+_RE_MATCH = re.compile(r"match=([^,)]+)")
+_RE_SCORE = re.compile(r"score=(-?[\d.]+)")
+
+_iniciado = False
+_iniciar_lock = threading.Lock()
+
+
+# =======================================================
+# Conexión
+# =======================================================
+def _conectar():
+    """Conexión nueva por operación (sirve desde cualquier hilo)."""
+    global _iniciado
+    con = sqlite3.connect(HISTORIAL_DB, timeout=10)
+    if not _iniciado:
+        with _iniciar_lock:
+            if not _iniciado:
+                _iniciar(con)
+                _iniciado = True
+    return con
+
+
+def _iniciar(con):
+    """
+    Esquema e importación inicial dentro de una transacción exclusiva: si
+    otro hilo o proceso ya creó la tabla, no se vuelve a importar.
+    """
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        nueva = con.execute("SELECT 1 FROM sqlite_master WHERE name = 'eventos'").fetchone() is None
+        for sentencia in _ESQUEMA.split(";"):
+            if sentencia.strip():
+                con.execute(sentencia)
+        if nueva:
+            _importar(con)
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+
+
+def _fila(entrada):
+    """Entrada del historial -> fila de la tabla (match/score del texto si faltan)."""
+    evento = entrada.get("evento", "")
+    match, score = entrada.get("match"), entrada.get("score")
+    if match is None:
+        m = _RE_MATCH.search(evento)
+        match = m.group(1) if m else None
+    if score is None:
+        m = _RE_SCORE.search(evento)
+        score = float(m.group(1)) if m else None
+    return entrada.get("fecha", ""), entrada.get("tipo", "INFO"), evento, match, score
+
+
+def _importar(con):
+    """
+    Primera vez: trae lo que ya había en el historial por líneas (los
+    segmentos rotados, del más viejo al más nuevo, y después
+    historial.jsonl) o, si no hay nada de eso, en historial.json.
+    """
+    from utils.historial import _segmentos   # diferida: utils.historial importa este módulo
+
+    fuentes = _segmentos()
+    if os.path.exists(HISTORIAL_LOG):
+        fuentes.append(HISTORIAL_LOG)
+
+    # Todo en un solo escribir: la importación queda en la misma transacción
+    entradas = []
+    for path in fuentes:
+        with (gzip.open if path.endswith(".gz") else open)(path, "rt", encoding="utf-8") as f:
+            for linea in f:
+                try: entradas.append(json.loads(linea))
+                except ValueError: pass
+    if not fuentes and os.path.exists(HISTORIAL_JSON):
+        with open(HISTORIAL_JSON, "r", encoding="utf-8") as f:
+            try: entradas = json.load(f)
+            except ValueError: pass
+    escribir(entradas, con)
+
+
+# =======================================================
+# API (la misma que usa utils.historial)
+# =======================================================
+def escribir(entradas, con=None):
+    propia = con is None
+    con = con or _conectar()
+    try:
+        with con:
+            con.executemany(
+                "INSERT INTO eventos (fecha, tipo, evento, match, score) VALUES (?, ?, ?, ?, ?)",
+                [_fila(e) for e in entradas]
+            )
+    finally:
+        if propia:
+            con.close()
+
+
+def podar(antes_de):
+    """Borra los eventos anteriores a `antes_de` ("AAAA-MM-DD hh:mm:ss")."""
+    con = _conectar()
+    try:
+        with con:
+            return con.execute("DELETE FROM eventos WHERE fecha < ?", (antes_de,)).rowcount
+    finally:
+        con.close()
+
+
+def leer():
+    con = _conectar()
+    try:
+        filas = con.execute("SELECT fecha, tipo, evento FROM eventos ORDER BY id").fetchall()
+    finally:
+        con.close()
+    return [{"fecha": f, "tipo": t, "evento": e} for f, t, e in filas]
+
+
+def borrar():
+    con = _conectar()
+    try:
+        with con:
+            con.execute("DELETE FROM eventos")
+    finally:
+        con.close()
+
+
+def consultar(pagina, por_pagina, tipo=None, desde=None, hasta=None):
+    condiciones, params = [], []
+    if tipo:
+        condiciones.append("tipo = ?")
+        params.append(tipo)
+    if desde:
+        condiciones.append("fecha >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append("fecha <= ?")
+        params.append(hasta + " 23:59:59")
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+
+    con = _conectar()
+    try:
+        total = con.execute(f"SELECT COUNT(*) FROM eventos {where}", params).fetchone()[0]
+        filas = con.execute(
+            f"SELECT fecha, tipo, evento FROM eventos {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+            params + [por_pagina, (max(pagina, 1) - 1) * por_pagina]
+        ).fetchall()
+    finally:
+        con.close()
+    return [{"fecha": f, "tipo": t, "evento": e} for f, t, e in filas], total
+
+
+def estadisticas(dias=30):
+    """Aciertos/fallos por día, distribución de scores y voces más reconocidas."""
+    con = _conectar()
+    try:
+        por_dia = con.execute(
+            """
+            SELECT substr(fecha, 1, 10) AS dia,
+                   SUM(tipo = 'ACCESO') AS ok,
+                   SUM(tipo = 'ERROR') AS fallidos
+            FROM eventos
+            WHERE score IS NOT NULL
+            GROUP BY dia ORDER BY dia DESC LIMIT ?
+            """, (dias,)
+        ).fetchall()
+
+        scores = con.execute(
+            """
+            SELECT MIN(CAST(score * 10 AS INTEGER), 9) / 10.0 AS desde, COUNT(*)
+            FROM eventos
+            WHERE score IS NOT NULL
+            GROUP BY desde ORDER BY desde
+            """
+        ).fetchall()
+
+        voces = con.execute(
+            """
+            SELECT match, COUNT(*) AS veces, AVG(score)
+            FROM eventos
+            WHERE match IS NOT NULL AND tipo = 'ACCESO'
+            GROUP BY match ORDER BY veces DESC LIMIT 10
+            """
+        ).fetchall()
+    finally:
+        con.close()
+
+    return {
+        "por_dia": [
+            {"dia": d, "ok": ok, "fallidos": mal, "tasa_ok": ok / (ok + mal) if ok + mal else None}
+            for d, ok, mal in por_dia
+        ],
+        "scores": [{"desde": round(d, 1), "cantidad": n} for d, n in scores],
+        "voces": [{"match": m, "veces": n, "score_medio": s} for m, n, s in voces],
+    }
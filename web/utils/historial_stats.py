@@ -0,0 +1,62 @@
+# utils/historial_stats.py
+#
+# Contadores del historial que se suman al escribir cada lote, así consultar
+# totales, tasas y la distribución de scores no recorre el log.
+
+import re
+from config import HISTORIAL_STATS_HORAS
+
+VERSION = 1
+BUCKETS_SCORE = 20   # de 0.05 entre 0 y 1
+
+_RE_SCORE = re.compile(r"score=(-?[\d.]+)")
+
+
+def vacias():
+    return {
+        "version": VERSION,
+        "hasta": 0,            # bytes del log ya contados (backend jsonl)
+        "eventos": 0,
+        "por_tipo": {},
+        "por_hora": {},        # "AAAA-MM-DD hh" -> {tipo: cantidad}
+        "verificaciones": {"ok": 0, "fallidos": 0},
+        "scores": [0] * BUCKETS_SCORE,
+        "scores_negativos": 0,
+    }
+
+
+def _score(entrada):
+    if entrada.get("score") is not None:
+        return float(entrada["score"])
+    m = _RE_SCORE.search(entrada.get("evento", ""))
+    return float(m.group(1)) if m else None
+
+
+def sumar(stats, entradas):
+    """Suma un lote de entradas a los contadores (en el lugar)."""
+    for e in entradas:
+        tipo = e.get("tipo", "INFO")
+        stats["eventos"] += 1
+        stats["por_tipo"][tipo] = stats["por_tipo"].get(tipo, 0) + 1
+
+        hora = stats["por_hora"].setdefault(e.get("fecha", "")[:13], {})
+        hora[tipo] = hora.get(tipo, 0) + 1
+
+        score = _score(e)
+        if score is None:
+            continue
+        stats["verificaciones"]["ok" if tipo == "ACCESO" else "fallidos"] += 1
+        if score < 0:
+            stats["scores_negativos"] += 1
+        else:
+            stats["scores"][min(int(score * BUCKETS_SCORE), BUCKETS_SCORE - 1)] += 1
+
+    # Solo las últimas horas: el archivo no crece con el log
+    if len(stats["por_hora"]) > HISTORIAL_STATS_HORAS:
+        for h in sorted(stats["por_hora"])[:-HISTORIAL_STATS_HORAS]:
+            del stats["por_hora"][h]
+    return stats
+
+
+def valida(stats):
+    return isinstance(stats, dict) and stats.get("version") == VERSION
@@ -0,0 +1,212 @@
+# utils/indice_ann.py
+
+import os
+import tempfile
+import numpy as np
+
+
+def preparar(v):
+    """
+    Centra y normaliza un vector: así el producto punto entre dos
+    vectores preparados es su correlación de Pearson.
+    """
+    v = np.asarray(v, dtype=np.float32)
+    v = v - v.mean()
+    return v / (np.linalg.norm(v) + 1e-9)
+
+
+class IndiceIVF:
+    """
+    Índice aproximado de vecinos (IVF) hecho solo con numpy.
+
+    Los vectores se reparten en `n_listas` grupos con k-means; una búsqueda
+    compara contra los `nprobe` centroides más cercanos y solo recorre los
+    vectores de esas listas. Más nprobe = más recall y más latencia.
+    """
+
+    def __init__(self, dim, n_listas=64):
+        self.dim = dim
+        self.n_listas = n_listas
+        self.centroides = None            # (n_listas, dim) o None si no se entrenó
+        self.entrenado_con = 0            # cantidad de vectores en el último entrenamiento
+
+        self.claves = []
+        self.vectores = np.zeros((0, dim), dtype=np.float32)
+        self.listas = np.zeros(0, dtype=np.int32)
+        self._pos = {}
+        self._invertidas = None   # (filas ordenadas por lista, inicio de cada lista)
+
+    def __len__(self):
+        return len(self.claves)
+
+    def __contains__(self, clave):
+        return clave in self._pos
+
+    # ---------------------------------------------------
+    # Altas y bajas
+    # ---------------------------------------------------
+    def agregar(self, clave, vector):
+        v = preparar(vector)
+        lista = self._asignar(v[None, :])[0]
+
+        if clave in self._pos:
+            i = self._pos[clave]
+            self.vectores[i] = v
+            self.listas[i] = lista
+        else:
+            self._pos[clave] = len(self.claves)
+            self.claves.append(clave)
+            self.vectores = np.vstack((self.vectores, v[None, :]))
+            self.listas = np.append(self.listas, np.int32(lista))
+
+        self._invertidas = None
+
+        # Reentrenar cuando la cantidad se duplica desde el último entrenamiento
+        n = len(self.claves)
+        if n >= 4 * self.n_listas and n >= 2 * self.entrenado_con:
+            self.entrenar()
+
+    def agregar_lote(self, claves, vectores):
+        """
+        Alta (o reemplazo) de varios vectores con una sola copia de la
+        matriz; se reentrena a lo sumo una vez al final.
+        """
+        # Una fila por clave (si se repite, gana la última)
+        filas = {clave: preparar(vector) for clave, vector in zip(claves, vectores)}
+        if not filas:
+            return
+        V = np.stack(list(filas.values()))
+        listas = self._asignar(V)
+
+        nuevas = []
+        for j, clave in enumerate(filas):
+            i = self._pos.get(clave)
+            if i is None:
+                self._pos[clave] = len(self.claves)
+                self.claves.append(clave)
+                nuevas.append(j)
+            else:
+                self.vectores[i] = V[j]
+                self.listas[i] = listas[j]
+
+        if nuevas:
+            self.vectores = np.vstack((self.vectores, V[nuevas]))
+            self.listas = np.append(self.listas, listas[nuevas])
+
+        self._invertidas = None
+
+        n = len(self.claves)
+        if n >= 4 * self.n_listas and n >= 2 * self.entrenado_con:
+            self.entrenar()
+
+    def eliminar(self, clave):
+        i = self._pos.pop(clave, None)
+        if i is None:
+            return False
+
+        # Mover el último al hueco (borrado en O(1))
+        ultimo = len(self.claves) - 1
+        if i != ultimo:
+            self.claves[i] = self.claves[ultimo]
+            self.vectores[i] = self.vectores[ultimo]
+            self.listas[i] = self.listas[ultimo]
+            self._pos[self.claves[i]] = i
+        self.claves.pop()
+        self.vectores = self.vectores[:ultimo]
+        self.listas = self.listas[:ultimo]
+        self._invertidas = None
+        return True
+
+    # ---------------------------------------------------
+    # Entrenamiento (k-means esférico)
+    # ---------------------------------------------------
+    def entrenar(self, iteraciones=15, semilla=0):
+        n = len(self.claves)
+        if n < self.n_listas:
+            return
+
+        rng = np.random.default_rng(semilla)
+        C = self.vectores[rng.choice(n, self.n_listas, replace=False)].copy()
+
+        for _ in range(iteraciones):
+            asignacion = np.argmax(self.vectores @ C.T, axis=1)
+            for j in range(self.n_listas):
+                miembros = self.vectores[asignacion == j]
+                if len(miembros):
+                    c = miembros.sum(axis=0)
+                    C[j] = c / (np.linalg.norm(c) + 1e-9)
+
+        self.centroides = C
+        self.listas = np.argmax(self.vectores @ C.T, axis=1).astype(np.int32)
+        self.entrenado_con = n
+        self._invertidas = None
+
+    def _asignar(self, V):
+        if self.centroides is None:
+            return np.zeros(len(V), dtype=np.int32)
+        return np.argmax(V @ self.centroides.T, axis=1).astype(np.int32)
+
+    # ---------------------------------------------------
+    # Búsqueda
+    # ---------------------------------------------------
+    def buscar(self, vector, k=10, nprobe=8):
+        """Devuelve [(clave, similitud)] de los k más parecidos."""
+        if not self.claves:
+            return []
+
+        q = preparar(vector)
+        if self.centroides is None:
+            filas = np.arange(len(self.claves))
+        else:
+            cercanos = np.argsort(-(self.centroides @ q))[:nprobe]
+            orden, inicio = self._listas_invertidas()
+            filas = np.concatenate([orden[inicio[j]:inicio[j + 1]] for j in cercanos])
+
+        sims = self.vectores[filas] @ q
+        k = min(k, len(filas))
+        if k == 0:
+            return []
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(self.claves[filas[t]], float(sims[t])) for t in top]
+
+    def _listas_invertidas(self):
+        """Filas agrupadas por lista; se rearma solo tras altas o bajas."""
+        if self._invertidas is None:
+            orden = np.argsort(self.listas, kind="stable")
+            conteo = np.bincount(self.listas, minlength=self.n_listas)
+            inicio = np.concatenate(([0], np.cumsum(conteo)))
+            self._invertidas = (orden, inicio)
+        return self._invertidas
+
+    # ---------------------------------------------------
+    # Persistencia
+    # ---------------------------------------------------
+    def guardar(self, path):
+        # Temporal único en la misma carpeta: varios procesos pueden guardar a la vez
+        fd, tmp = tempfile.mkstemp(suffix=".tmp.npz", dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                dim=self.dim,
+                n_listas=self.n_listas,
+                entrenado_con=self.entrenado_con,
+                centroides=self.centroides if self.centroides is not None else np.zeros((0, self.dim)),
+                claves=np.array(self.claves, dtype=str),
+                vectores=self.vectores,
+                listas=self.listas,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def cargar(cls, path):
+        with np.load(path) as data:
+            indice = cls(int(data["dim"]), int(data["n_listas"]))
+            indice.entrenado_con = int(data["entrenado_con"])
+            if len(data["centroides"]):
+                indice.centroides = data["centroides"].astype(np.float32)
+            indice.claves = [str(c) for c in data["claves"]]
+            indice.vectores = data["vectores"].astype(np.float32)
+            indice.listas = data["listas"].astype(np.int32)
+        indice._pos = {c: i for i, c in enumerate(indice.claves)}
+        return indice
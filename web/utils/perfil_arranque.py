@@ -0,0 +1,58 @@
+# utils/perfil_arranque.py
+
+import subprocess
+import sys
+
+from config import BASE_DIR
+
+# Módulos que se cargan recién en la primera petición que los usa
+MODULOS_DIFERIDOS = [
+    "numpy",
+    "soundfile",
+    "librosa",
+    "matplotlib.pyplot",
+    "services.voz_service",
+    "services.graficos_service",
+]
+
+
+def _tiempos_import(codigo):
+    """
+    Corre `codigo` en un intérprete nuevo con -X importtime.
+    Devuelve ({módulo: (propio_ms, acumulado_ms)}, total_ms), donde el total
+    suma solo las importaciones de primer nivel (sin contar dos veces).
+    """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+
+    tiempos, total = {}, 0.0
+    for linea in res.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        acumulado = int(acumulado) / 1000
+        if not nombre.startswith("  "):
+            total += acumulado
+        tiempos[nombre.strip()] = (int(propio) / 1000, acumulado)
+    return tiempos, total
+
+
+def medir_arranque(top=15):
+    """Imprime cuánto cuesta importar la app y cada módulo pesado."""
+    tiempos, base = _tiempos_import("import app")
+
+    print(f"Arranque de la app (import app): {tiempos.get('app', (0, 0))[1]:.0f} ms")
+    print(f"\n{'módulo':<40}{'propio ms':>12}{'acumulado ms':>15}")
+    for nombre, (propio, acum) in sorted(tiempos.items(), key=lambda t: -t[1][1])[:top]:
+        print(f"{nombre:<40}{propio:>12.1f}{acum:>15.1f}")
+
+    print("\nCosto extra en la primera petición que los usa:")
+    for modulo in MODULOS_DIFERIDOS:
+        _, total = _tiempos_import(f"import app; import {modulo}")
+        print(f"  {modulo:<38}{max(total - base, 0):>10.0f} ms")
+
+
+if __name__ == "__main__":
+    medir_arranque()